@@ -12,6 +12,8 @@ if UTILS_DIR not in sys.path:
 import streamlit as st
 import importlib
 from auth import login, logout, login_page_format  
+from utils import warmup
+from db.migrations import migrate
 import os, sys
 
 
@@ -20,13 +22,22 @@ col1, col2, col3 = st.columns(3)
 with col2:
     login_page_format()
 
+@st.cache_resource
+def _init_db():
+    # Once per server process: bring db/app_data.db up to the current schema.
+    return migrate()
+
+
+_init_db()
+
 # Role-based page definitions
 PAGE_CONFIG = {
     "Admin": {
         "Dashboard": "dashboard",
         "Upload Transactions": "bulk_upload",
         "Change Password": "change_password",
-        "Add User": "register_user"
+        "Add User": "register_user",
+        "Performance": "performance"
     },
     "Staff": {
         "Dashboard": "dashboard",
@@ -38,9 +49,13 @@ PAGE_CONFIG = {
 if "authenticated" not in st.session_state:
     st.session_state["authenticated"] = False
 
+# Pre-import every page module (and prime its caches) in the background
+warmup.start(sorted({m for pages in PAGE_CONFIG.values() for m in pages.values()}))
+
 if not st.session_state["authenticated"]:
     with col2:
         login()
+    warmup.mark("first_login_render")
 else:
     role = st.session_state["user"]["role"]
     username = st.session_state["user"]["username"]
@@ -52,12 +67,21 @@ else:
 
     # Navigation based on role
     allowed_pages = PAGE_CONFIG.get(role, {})
+    if not allowed_pages:
+        st.error(f"No pages are configured for the role '{role}'. Please contact an administrator.")
+        if st.sidebar.button("🚪 Logout"):
+            logout()
+        st.stop()
     page_choice = st.sidebar.radio("📂 Application Menu", list(allowed_pages.keys()))
 
     # Load and run selected page
     module_name = allowed_pages[page_choice]
     module = importlib.import_module(module_name)
-    module.run()
+    try:
+        module.run()
+    finally:
+        # Also when run() ends early with st.stop() (e.g. an empty dashboard).
+        warmup.mark(f"first_{module_name}_view")
 
     # Logout button
     if st.sidebar.button("🚪 Logout"):
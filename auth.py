@@ -1,13 +1,40 @@
+import os
+import time
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import bcrypt
-from sqlalchemy import text
-from db.database import get_engine
+from sqlalchemy import text, bindparam
+from db.database import get_engine, begin_immediate
 from datetime import datetime
+from utils import perf, password_hashing
+
+# bcrypt releases the GIL, so a small thread pool verifies hashes in
+# parallel without letting a burst of logins starve other sessions' reruns.
+AUTH_MAX_CONCURRENCY = int(os.environ.get("AUTH_MAX_CONCURRENCY", "2"))
+AUTH_QUEUE_TIMEOUT = float(os.environ.get("AUTH_QUEUE_TIMEOUT", "10"))
+AUTH_MAX_FAILURES = int(os.environ.get("AUTH_MAX_FAILURES", "5"))
+# Higher per-IP limit: the whole office often shares one address.
+AUTH_MAX_IP_FAILURES = int(os.environ.get("AUTH_MAX_IP_FAILURES", "20"))
+AUTH_LOCKOUT_SECONDS = int(os.environ.get("AUTH_LOCKOUT_SECONDS", "300"))
+# Upper bound on tracked usernames/IPs, so a spray of unique usernames
+# cannot grow the failure table without limit.
+AUTH_MAX_TRACKED_KEYS = int(os.environ.get("AUTH_MAX_TRACKED_KEYS", "10000"))
+
+_verify_pool = ThreadPoolExecutor(max_workers=AUTH_MAX_CONCURRENCY, thread_name_prefix="bcrypt")
+# Bounds the queue as well as the workers: at most twice the pool size
+# may be waiting for a bcrypt slot.
+_verify_slots = threading.BoundedSemaphore(AUTH_MAX_CONCURRENCY * 2)
+
+# key -> deque of failure times, least recently failed first.
+_failures = OrderedDict()
+_failures_lock = threading.Lock()
 
 
 def hash_password(password: str) -> str:
     """Hashes a plain password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return password_hashing.hash_password(password)
 
 
 def check_password(plain_password: str, hashed_password: str) -> bool:
@@ -15,24 +42,96 @@ def check_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
-def authenticate_user(username, password):
+def _throttle_keys(username, ip):
+    """(key, limit) pairs checked on every login attempt."""
+    keys = [(("user", username), AUTH_MAX_FAILURES)]
+    if ip:
+        keys.append((("ip", ip), AUTH_MAX_IP_FAILURES))
+    return keys
+
+
+def _check_throttle(keys):
+    """Raises ValueError if any key has too many recent failures."""
+    now = time.monotonic()
+    with _failures_lock:
+        for key, limit in keys:
+            attempts = _failures.get(key)
+            if not attempts:
+                continue
+            while attempts and now - attempts[0] > AUTH_LOCKOUT_SECONDS:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                wait = int(AUTH_LOCKOUT_SECONDS - (now - attempts[0])) + 1
+                raise ValueError(f"Too many failed login attempts. Try again in {wait} seconds.")
+
+
+def _record_failure(keys):
+    now = time.monotonic()
+    with _failures_lock:
+        for key, limit in keys:
+            _failures.setdefault(key, deque(maxlen=limit)).append(now)
+            _failures.move_to_end(key)
+        _sweep_failures(now)
+
+
+def _sweep_failures(now):
+    """Drops keys whose latest failure has expired, then the oldest beyond the cap."""
+    while _failures:
+        key, attempts = next(iter(_failures.items()))
+        if attempts and now - attempts[-1] <= AUTH_LOCKOUT_SECONDS and len(_failures) <= AUTH_MAX_TRACKED_KEYS:
+            break
+        _failures.popitem(last=False)
+
+
+def _clear_failures(keys):
+    with _failures_lock:
+        for key, _ in keys:
+            _failures.pop(key, None)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """check_password on the bcrypt pool; raises ValueError if the pool is saturated."""
+    if not _verify_slots.acquire(timeout=AUTH_QUEUE_TIMEOUT):
+        raise ValueError("Login service is busy. Please try again.")
+    try:
+        return _verify_pool.submit(check_password, plain_password, hashed_password).result()
+    finally:
+        _verify_slots.release()
+
+
+def _client_ip():
+    try:
+        return st.context.ip_address
+    except Exception:
+        return None
+
+
+@perf.timed("auth.authenticate_user")
+def authenticate_user(username, password, ip=None):
+    """Returns the user dict, None on bad credentials; raises ValueError when throttled."""
+    keys = _throttle_keys(username, ip)
+    _check_throttle(keys)
+
     engine = get_engine()
-    query = text("SELECT * FROM users WHERE username = :username")
+    query = text("SELECT id, username, role, first_name, agency, password FROM users WHERE username = :username")
     
     with engine.connect() as conn:
         result = conn.execute(query, {"username": username}).mappings().fetchone()
 
-    if result and check_password(password, result["password"]):
+    if result and verify_password(password, result["password"]):
+        _clear_failures(keys[:1])
         return {
             "id": result["id"],
             "username": result["username"],
             "role": result["role"],
-            "first_name":result["first_name"]
+            "first_name":result["first_name"],
+            "agency": result["agency"]
         }
+    _record_failure(keys)
     return None
 
 
-def register_user(first_name, middle_name, last_name, username, password, role):
+def register_user(first_name, middle_name, last_name, username, password, role, agency=None):
     try:
         current_user = st.session_state.get("user", {}).get("username", "system")
         now = datetime.now()
@@ -45,9 +144,9 @@ def register_user(first_name, middle_name, last_name, username, password, role):
             conn.execute(
                 text("""
                     INSERT INTO users 
-                    (first_name, middle_name, last_name, username, password, role, added_by, date, time)
+                    (first_name, middle_name, last_name, username, password, role, agency, added_by, date, time)
                     VALUES 
-                    (:first_name, :middle_name, :last_name, :username, :password, :role, :added_by, :date, :time)
+                    (:first_name, :middle_name, :last_name, :username, :password, :role, :agency, :added_by, :date, :time)
                 """), 
                 {
                     "first_name": first_name,
@@ -56,6 +155,7 @@ def register_user(first_name, middle_name, last_name, username, password, role):
                     "username": username,
                     "password": hashed_password,
                     "role": role,
+                    "agency": agency or None,
                     "added_by": current_user,
                     "date": date,
                     "time": time
@@ -67,6 +167,118 @@ def register_user(first_name, middle_name, last_name, username, password, role):
         print("Registration Error:", e)
         return False
 
+# Roles with a page set in app.py's PAGE_CONFIG; keep the two in sync.
+USER_ROLES = ["Admin", "Staff"]
+DEFAULT_ROLE = "Staff"
+BULK_REQUIRED_FIELDS = ["first_name", "last_name", "username", "password"]
+
+
+@perf.timed("auth.bulk_register_users")
+def bulk_register_users(rows, agencies=None):
+    """Registers many users in one transaction.
+
+    rows are dicts with the register_user fields (first_name, middle_name,
+    last_name, username, password, role, agency); role defaults to
+    DEFAULT_ROLE. With agencies (the known agency names), a row's agency
+    must match one of them, ignoring case, and is stored as spelled there.
+    Incomplete rows, unknown agencies and usernames repeated in the batch
+    or already taken are rejected before any password is hashed; the rest
+    are hashed on a thread pool and inserted with one executemany.
+
+    Returns one {"row", "username", "ok", "error"} dict per input row.
+    """
+    results = [
+        {"row": i, "username": str(row.get("username") or "").strip(), "ok": False, "error": None}
+        for i, row in enumerate(rows)
+    ]
+
+    known = None if agencies is None else {a.strip().casefold(): a for a in agencies}
+    agency_of = {}
+
+    seen = set()
+    pending = []
+    for i, row in enumerate(rows):
+        missing = [f for f in BULK_REQUIRED_FIELDS if not str(row.get(f) or "").strip()]
+        role = str(row.get("role") or DEFAULT_ROLE).strip()
+        agency = str(row.get("agency") or "").strip()
+        username = results[i]["username"]
+        if missing:
+            results[i]["error"] = "Missing " + ", ".join(missing)
+        elif role not in USER_ROLES:
+            results[i]["error"] = f"Unknown role '{role}'"
+        elif agency and known is not None and agency.casefold() not in known:
+            results[i]["error"] = f"Unknown agency '{agency}'"
+        elif username in seen:
+            results[i]["error"] = "Username repeated earlier in this batch"
+        else:
+            seen.add(username)
+            agency_of[i] = (known or {}).get(agency.casefold(), agency) or None
+            pending.append(i)
+
+    if not pending:
+        return results
+
+    existing_query = text("SELECT username FROM users WHERE username IN :names").bindparams(
+        bindparam("names", expanding=True)
+    )
+    engine = get_engine()
+    with engine.connect() as conn:
+        taken = {r[0] for r in conn.execute(existing_query, {"names": [results[i]["username"] for i in pending]})}
+    for i in pending:
+        if results[i]["username"] in taken:
+            results[i]["error"] = "Username already exists"
+    pending = [i for i in pending if results[i]["error"] is None]
+    if not pending:
+        return results
+
+    hashes = password_hashing.hash_many(str(rows[i]["password"]) for i in pending)
+
+    current_user = st.session_state.get("user", {}).get("username", "system")
+    now = datetime.now()
+    try:
+        with begin_immediate() as conn:
+            # Re-checked under the write lock: someone may have registered
+            # one of these names while the batch was hashing.
+            taken = {r[0] for r in conn.execute(existing_query, {"names": [results[i]["username"] for i in pending]})}
+            accepted = []
+            for i, hashed in zip(pending, hashes):
+                if results[i]["username"] in taken:
+                    results[i]["error"] = "Username already exists"
+                else:
+                    accepted.append((i, hashed))
+
+            if accepted:
+                conn.execute(text("""
+                    INSERT INTO users
+                    (first_name, middle_name, last_name, username, password, role, agency, added_by, date, time)
+                    VALUES
+                    (:first_name, :middle_name, :last_name, :username, :password, :role, :agency, :added_by, :date, :time)
+                """), [
+                    {
+                        "first_name": str(rows[i]["first_name"]).strip(),
+                        "middle_name": str(rows[i].get("middle_name") or "").strip(),
+                        "last_name": str(rows[i]["last_name"]).strip(),
+                        "username": results[i]["username"],
+                        "password": hashed,
+                        "role": str(rows[i].get("role") or DEFAULT_ROLE).strip(),
+                        "agency": agency_of[i],
+                        "added_by": current_user,
+                        "date": str(now.date()),
+                        "time": str(now.time())
+                    }
+                    for i, hashed in accepted
+                ])
+    except Exception as e:
+        print("Bulk registration failed:", e)
+        for i in pending:
+            results[i]["error"] = results[i]["error"] or f"Batch rolled back: {e}"
+        return results
+
+    for i, _ in accepted:
+        results[i]["ok"] = True
+    return results
+
+
 def login_page_format():
     col1, col2, col3 = st.columns(3)
     with col2:
@@ -88,7 +300,11 @@ def login():
     login_button = st.button("Login")
 
     if login_button:
-        user = authenticate_user(username, password)
+        try:
+            user = authenticate_user(username, password, ip=_client_ip())
+        except ValueError as ve:
+            st.error(f"🚫 {ve}")
+            return
         if user:
             st.session_state["authenticated"] = True
             st.session_state["user"] = user
@@ -8,8 +8,16 @@ from utils.google_oauth_io import (
     append_df_to_gsheet
 )
 
-st.title("Payroll Upload")
+
+def warm():
+    """Called by the app's warm-up thread: pre-imports the Google client libraries."""
+    import gspread
+    import googleapiclient.discovery
+    import googleapiclient.http
+
+
 def run():
+    st.title("Payroll Upload")
     current_user = st.session_state.get("user", {}).get("username", "system")
     SHEET_ID = "1BJd1ezT7UL3ka1XGYSQ25ZBYmXpw0jUh9UxAPTZ2ngA"
     WORKSHEET = "transactions"
@@ -1,8 +1,9 @@
 import streamlit as st
 from db_operations import update_user_password
 
-st.title("🔐 Change Your Password")
+
 def run():
+    st.title("🔐 Change Your Password")
     current_user = st.session_state.get("user", {}).get("username", "system")
 
     # Replace this with your login logic or session
@@ -1,11 +1,6 @@
 import numpy as np
-try:
-    import plotly.graph_objects as go
-    PLOTLY_OK = True
-except Exception:
-    PLOTLY_OK = False
-
 import os, sys
+from pathlib import Path
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 if ROOT_DIR not in sys.path:
@@ -13,45 +8,80 @@ if ROOT_DIR not in sys.path:
 
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import gspread
+from datetime import datetime
 
-from google_oauth_io import get_oauth_creds
+from utils.google_oauth_io import get_oauth_creds
+from utils import shared_dataset, perf, payroll_recon, employee_search, export, table_pager, sheet_shards
 
 
-def run():
-    st.title("📊 Payroll Activity Dashboard")
+SHEET_ID = "1BJd1ezT7UL3ka1XGYSQ25ZBYmXpw0jUh9UxAPTZ2ngA"
+WORKSHEET = "transactions"
+MASTER_TTL = 300
+# Newest payroll months loaded when the page opens.
+DEFAULT_MONTHS = 3
 
-    SHEET_ID = "1BJd1ezT7UL3ka1XGYSQ25ZBYmXpw0jUh9UxAPTZ2ngA"
-    WORKSHEET = "transactions"
+EXPECTED_HEADERS = [
+    "NO", "Employee ID", "First Name", "Middle Name", "Last Name",
+    "Gender", "Agency Code", "Agency", "Adj. Salary", "Current Salary",
+    "Difference", "Current Position", "New position", "Reason",
+    "LRD BANK", "LRD BANK ACCOUNT", "USD BANK", "USD ACCOUNT",
+    "DOB", "Analyst", "uploaded_by", "uploaded_at"
+]
 
-    EXPECTED_HEADERS = [
-        "NO", "Employee ID", "First Name", "Middle Name", "Last Name",
-        "Gender", "Agency Code", "Agency", "Adj. Salary", "Current Salary",
-        "Difference", "Current Position", "New position", "Reason",
-        "LRD BANK", "LRD BANK ACCOUNT", "USD BANK", "USD ACCOUNT",
-        "DOB", "Analyst", "uploaded_by", "uploaded_at"
-    ]
 
-    @st.cache_data(ttl=300)
-    def load_master(_creds):
-        gc = gspread.authorize(_creds)
-        ws = gc.open_by_key(SHEET_ID).worksheet(WORKSHEET)
-        data = ws.get_all_records(expected_headers=EXPECTED_HEADERS)
-        return pd.DataFrame(data)
+def _plotting():
+    """Imports matplotlib and plotly on first chart render, not at page import."""
+    import matplotlib.pyplot as plt
+    try:
+        import plotly.graph_objects as go
+    except Exception:
+        go = None
+    return plt, go
 
-    creds = get_oauth_creds()
-    # st.write("Scopes granted:", creds.scopes)
 
-    df = load_master(creds)
+def _read_records(ws):
+    return pd.DataFrame(ws.get_all_records(expected_headers=EXPECTED_HEADERS))
 
-    if df.empty:
-        st.info("No data yet. Upload a worksheet first.")
-        st.stop()
 
-    # -----------------------------
-    # Clean + type conversions
-    # -----------------------------
+@st.cache_data(ttl=MASTER_TTL)
+def load_manifest(_creds):
+    """The shard manifest, or None while the master sheet is not sharded."""
+    import gspread
+
+    return sheet_shards.read_manifest(gspread.authorize(_creds), SHEET_ID)
+
+
+@perf.timed("dashboard.load_master")
+def load_master(creds, months=None):
+    """Master sheet rows of the given payroll months (None: every month).
+
+    Only the shards the manifest lists for those months are read, several
+    at once.
+    """
+    manifest = load_manifest(creds)
+    if manifest is None:
+        # Not sharded yet: everything is still in the one worksheet.
+        shards = [(SHEET_ID, WORKSHEET)]
+    else:
+        shards = sheet_shards.shards_for(manifest, months if months is not None else sheet_shards.months(manifest))
+
+    frames = sheet_shards.read_shards(creds, shards, _read_records)
+    if not frames:
+        return pd.DataFrame(columns=EXPECTED_HEADERS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _load_months(creds, months=None):
+    df = prepare_master(load_master(creds, months))
+    if months is not None:
+        # The pre-sharding worksheet holds every month; keep the asked ones.
+        df = df[df["payroll_month"].isin(list(months))].reset_index(drop=True)
+    return df
+
+
+@perf.timed("dashboard.clean")
+def prepare_master(df):
+    """Type conversions and derived columns shared by every session."""
     # Numeric cols
     for col in ["Adj. Salary", "Current Salary", "Difference"]:
         if col in df.columns:
@@ -66,34 +96,351 @@ def run():
     if "DOB" in df.columns:
         df["DOB"] = pd.to_datetime(df["DOB"], errors="coerce")
 
-    if "uploaded_at" in df.columns:
-        df["uploaded_at"] = pd.to_datetime(df["uploaded_at"], errors="coerce")
-
     # -----------------------------
     # Payroll Month derivation
     # -----------------------------
-    # Prefer a real payroll month column if present, else derive from uploaded_at
-    payroll_month_col = None
-    for c in ["Payroll Month", "Payroll_month", "payroll_month", "Month", "PayrollMonth"]:
-        if c in df.columns:
-            payroll_month_col = c
-            break
-
-    if payroll_month_col:
-        df["payroll_month"] = df[payroll_month_col].astype(str).str.strip()
+    # "YYYY-MM" from a real payroll month column if present, else from
+    # uploaded_at — the same key uploads are sharded by.
+    df["payroll_month"] = sheet_shards.month_key(df)
+
+    return df
+
+
+@st.cache_data(ttl=MASTER_TTL, max_entries=8)
+def _load_prepared_local(_creds, months=None):
+    df = _load_months(_creds, months)
+    df.attrs["version"] = f"{datetime.now().strftime('%Y%m%d%H%M%S')}:{','.join(months or [])}"
+    return df
+
+
+# One partition file per (agency, month): a session maps only the
+# partitions of its agency and the months it picked. Months are loaded
+# from Sheets as they are first asked for and refreshed one by one.
+PARTITION_BY = ["Agency", "payroll_month"]
+
+
+def _ensure_master(creds, months=None):
+    """Loads the given months (None: every month) into the shared dataset if stale."""
+    manifest = load_manifest(creds)
+    if manifest is None:
+        # The one legacy worksheet can only be read whole.
+        wanted = None
     else:
-        # derive from uploaded_at
-        if "uploaded_at" in df.columns:
-            df["payroll_month"] = df["uploaded_at"].dt.to_period("M").astype(str)
+        wanted = list(months) if months else sheet_shards.months(manifest)
+    shared_dataset.ensure_partitions(
+        "master", "payroll_month", wanted, lambda stale: _load_months(creds, stale),
+        max_age=MASTER_TTL, partition_by=PARTITION_BY,
+    )
+
+
+def available_months(creds):
+    """Payroll months in the master data, newest first ("undated" last)."""
+    manifest = load_manifest(creds)
+    if manifest is not None:
+        return sheet_shards.months(manifest)
+    if shared_dataset.ARROW_OK:
+        _ensure_master(creds)
+        values = shared_dataset.partition_values("master", "payroll_month")
+    else:
+        df = _load_prepared_local(creds)
+        values = df["payroll_month"].dropna().unique() if "payroll_month" in df.columns else []
+    return sheet_shards.sort_months(values)
+
+
+def known_agencies():
+    """Agency names in the published master data (the months loaded so far)."""
+    if not shared_dataset.ARROW_OK:
+        return []
+    return shared_dataset.partition_labels("master", "Agency")
+
+
+def default_months(options):
+    """The newest DEFAULT_MONTHS dated months of options."""
+    return tuple(m for m in options if m != sheet_shards.UNDATED)[:DEFAULT_MONTHS]
+
+
+def load_prepared(creds, agency=None, months=None):
+    """Prepared master sheet, shared across processes when pyarrow is available.
+
+    With agency, only that agency's rows are returned; with months (an
+    iterable of "YYYY-MM"), only those payroll months, and only their
+    shards are read from Sheets.
+    """
+    months = tuple(sorted(months)) if months else None
+
+    if not shared_dataset.ARROW_OK:
+        df = _load_prepared_local(creds, months)
+        if not agency:
+            return df
+        scoped = df[shared_dataset.matches(df, {"Agency": agency})].reset_index(drop=True)
+        # The agency is part of the version: per-version caches (sort
+        # permutations, search index, reconciliation) must not mix scopes.
+        scoped.attrs["version"] = f"{df.attrs.get('version')}:{agency}"
+        return scoped
+
+    _ensure_master(creds, months)
+    where = {}
+    if agency:
+        where["Agency"] = agency
+    if months:
+        where["payroll_month"] = list(months)
+    df = shared_dataset.read("master", where=where or None)
+    if df is None:
+        return pd.DataFrame(columns=EXPECTED_HEADERS)
+    # Shallow copy: per-session columns (salary_band) must not land on
+    # the frame every other session is reading.
+    return df.copy(deep=False)
+
+
+def warm():
+    """Called by the app's warm-up thread: loads chart libraries and the master data."""
+    _plotting()
+    # Only with a saved token — a fresh OAuth flow needs a browser.
+    if os.path.exists("token.json"):
+        creds = get_oauth_creds()
+        load_prepared(creds, months=default_months(available_months(creds)))
+
+
+FILTER_COLUMNS = ["Agency", "Gender", "Reason", "Analyst", "uploaded_by", "payroll_month"]
+
+
+def _equals(series, value):
+    # Nullable string columns give <NA> for missing cells; treat as no match.
+    return series.eq(value).fillna(False).to_numpy(dtype=bool)
+
+
+def filter_mask(df, filters):
+    """Boolean row mask for the dashboard filter state built in run()."""
+    mask = np.ones(len(df), dtype=bool)
+
+    for col in FILTER_COLUMNS:
+        value = filters.get(col, "All")
+        if value != "All" and col in df.columns:
+            mask &= _equals(df[col], value)
+
+    # Bank filter logic
+    bank_col = {"LRD": "LRD BANK", "USD": "USD BANK"}.get(filters.get("bank_lane"))
+    if bank_col in df.columns and filters.get("bank_name", "All") != "All":
+        mask &= _equals(df[bank_col], filters["bank_name"])
+
+    # Salary band filter
+    salary_band = filters.get("salary_band", "All")
+    if salary_band != "All" and "salary_band" in df.columns:
+        mask &= (df["salary_band"].astype(str) == salary_band).to_numpy(dtype=bool)
+
+    # Date filter (inclusive of end date)
+    if filters.get("date_range") and "uploaded_at" in df.columns:
+        start_date, end_date = filters["date_range"]
+        uploaded = df["uploaded_at"]
+        mask &= (
+            (uploaded >= pd.Timestamp(start_date))
+            & (uploaded < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+        ).to_numpy(dtype=bool)
+
+    return mask
+
+
+@st.cache_data(ttl=MASTER_TTL, max_entries=20)
+def _reconcile_cached(version, month_a, month_b, _df):
+    # Keyed on the data version instead of hashing the whole frame.
+    with perf.span("dashboard.reconcile"):
+        return payroll_recon.reconcile(_df, month_a, month_b)
+
+
+def render_reconciliation(creds, agency, options):
+    """Compares two payroll months of the agency, whichever months the page loaded."""
+    st.subheader("Payroll Month Reconciliation")
+
+    months = sorted(m for m in options if m != sheet_shards.UNDATED)
+    if len(months) < 2:
+        st.info("Reconciliation needs Employee IDs in at least two payroll months.")
+        return
+
+    rcol1, rcol2, rcol3 = st.columns(3)
+    month_a = rcol1.selectbox("From month", months, index=len(months) - 2)
+    month_b = rcol2.selectbox("To month", months, index=len(months) - 1)
+    if month_a == month_b:
+        st.caption("Pick two different months to compare.")
+        return
+
+    df = load_prepared(creds, agency=agency, months=(month_a, month_b))
+    if "Employee ID" not in df.columns:
+        st.info("Reconciliation needs Employee IDs in at least two payroll months.")
+        return
+    result = _reconcile_cached(df.attrs.get("version"), month_a, month_b, df)
+    summary = payroll_recon.summarize(result)
+
+    k1, k2, k3, k4, k5 = st.columns(5)
+    k1.metric("New", f"{summary['new']:,}")
+    k2.metric("Dropped", f"{summary['dropped']:,}")
+    k3.metric("Changed", f"{summary['changed']:,}")
+    k4.metric("Duplicate", f"{summary['duplicate']:,}")
+    k5.metric("Net Difference Δ", f"{summary.get('Difference Δ', 0):,.2f}")
+
+    statuses = rcol3.multiselect(
+        "Show", payroll_recon.STATUSES, default=["new", "dropped", "changed", "duplicate"]
+    )
+    shown = result[result["status"].isin(statuses)]
+    st.caption(f"{len(shown):,} of {len(result):,} employees")
+    st.dataframe(shown.head(1000), use_container_width=True, hide_index=True)
+
+
+# One index per agency scope in use (all agencies for admins).
+@st.cache_resource(max_entries=8)
+def _search_index(version, _df):
+    # Built once per data version and shared by every session.
+    with perf.span("dashboard.search_index"):
+        return employee_search.build_index(_df)
+
+
+def render_employee_search(creds, agency):
+    """Searches the agency's full history, independent of the months loaded above."""
+    st.subheader("Employee Search")
+
+    query = st.text_input("Employee ID or name", placeholder="e.g. 10234 or Musu Kanneh")
+    if not query.strip():
+        return
+
+    # Every month, loaded only once someone actually searches.
+    df = load_prepared(creds, agency=agency)
+    if "Employee ID" not in df.columns:
+        st.info("No Employee ID column in the data.")
+        return
+
+    index = _search_index(df.attrs.get("version"), df)
+    with perf.span("dashboard.search"):
+        matches = employee_search.search(index, query)
+
+    if matches.empty:
+        st.caption("No matching employees.")
+        return
+
+    st.dataframe(matches, use_container_width=True, hide_index=True)
+
+    labels = {
+        f"{row['Employee ID']} — {row['Name']} ({row['Agency']})": row["Employee ID"]
+        for _, row in matches.iterrows()
+    }
+    chosen = st.selectbox("Transaction history for", list(labels))
+    rows = employee_search.history(index, df, labels[chosen])
+    st.caption(f"{len(rows):,} transactions across uploads")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def render_export(df, mask):
+    st.subheader("Export Filtered View")
+
+    ecol1, ecol2 = st.columns(2)
+    fmt = ecol1.selectbox("Format", list(export.FORMATS))
+    rows = int(mask.sum())
+    ecol2.caption(f"{rows:,} rows match the current filters.")
+    if fmt == "Excel (XLSX)" and rows > export.XLSX_SUGGEST_ROWS:
+        note = "Large Excel exports take a while to write; CSV or Parquet is much faster."
+        if rows >= export.XLSX_MAX_ROWS:
+            note += " Rows beyond Excel's limit of 1,048,575 per sheet continue on further sheets."
+        ecol1.info(note)
+
+    if ecol2.button("Prepare export"):
+        bar = st.progress(0.0, text="Writing export…")
+        with perf.span(f"dashboard.export.{fmt}"):
+            path = export.export(df, mask, fmt, progress=lambda done: bar.progress(done, text=f"Writing export… {done:.0%}"))
+        bar.empty()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = f"payroll_export_{stamp}{export.FORMATS[fmt][0]}"
+        try:
+            with open(path, "rb") as fh:
+                # Shown on this run only: later reruns (any filter click)
+                # don't read the file again. "ignore" keeps the click
+                # itself from rerunning the page and removing the button.
+                st.download_button(f"⬇️ Download {name}", fh, file_name=name,
+                                   mime=export.FORMATS[fmt][1], on_click="ignore")
+        finally:
+            # Streamlit holds the bytes now; the spool file has been served.
+            Path(path).unlink(missing_ok=True)
+
+
+# Per-session columns (salary_band depends on the chosen band width)
+# can't share a permutation cached by data version.
+UNSORTABLE_COLUMNS = {"salary_band"}
+
+
+@st.cache_resource(max_entries=32)
+def _sort_permutation(version, column, ascending, _df):
+    with perf.span("dashboard.browse.sort"):
+        return table_pager.sort_permutation(_df, column, ascending)
+
+
+def render_transaction_browser(df, mask):
+    st.subheader("All Transactions")
+
+    columns = [c for c in df.columns if c not in UNSORTABLE_COLUMNS]
+    default_sort = columns.index("uploaded_at") if "uploaded_at" in columns else 0
+
+    bcol1, bcol2, bcol3 = st.columns(3)
+    sort_col = bcol1.selectbox("Sort by", columns, index=default_sort)
+    ascending = bcol2.radio("Order", ["Descending", "Ascending"], horizontal=True) == "Ascending"
+    page_size = bcol3.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+
+    version = df.attrs.get("version")
+    permutation = _sort_permutation(version, sort_col, ascending, df)
+
+    # Reuse the filtered order across page flips; rebuild only when the
+    # data, sort or filters change.
+    key = (version, sort_col, ascending, table_pager.mask_key(mask))
+    cached = st.session_state.get("browse_order")
+    if cached is None or cached[0] != key:
+        with perf.span("dashboard.browse.filter"):
+            cached = (key, table_pager.filtered_order(permutation, mask))
+        st.session_state["browse_order"] = cached
+    order = cached[1]
+
+    pages = table_pager.page_count(len(order), page_size)
+    page_number = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, step=1)
+
+    with perf.span("dashboard.browse.page"):
+        rows = table_pager.page(df, order, int(page_number), page_size)
+
+    start = (int(page_number) - 1) * page_size
+    st.caption(f"Rows {start + 1 if len(order) else 0:,}–{start + len(rows):,} of {len(order):,}")
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def run():
+    st.title("📊 Payroll Activity Dashboard")
+
+    creds = get_oauth_creds()
+    # st.write("Scopes granted:", creds.scopes)
+
+    # The user's agency, if they are scoped to one; the Agency filter below
+    # only narrows within it.
+    scope = (st.session_state.get("user") or {}).get("agency")
+    if scope:
+        st.caption(f"Showing {scope} records only.")
+
+    months = None
+    options = available_months(creds)
+    if options:
+        chosen = st.multiselect(
+            "Payroll months to load", options, default=list(default_months(options)),
+            help="Only these months are loaded into the charts and tables. "
+                 "Reconciliation and employee search cover every month.",
+        )
+        if chosen and len(chosen) < len(options):
+            months = tuple(sorted(chosen))
+
+    df = load_prepared(creds, agency=scope, months=months)
+
+    if df.empty:
+        if not scope:
+            st.info("No data yet. Upload a worksheet first." if months is None
+                    else "No records in the selected payroll months.")
+        elif scope.casefold() not in {a.casefold() for a in known_agencies()}:
+            st.warning(f"Your account is limited to agency '{scope}', which has no records. "
+                       "Ask an administrator to check the agency on your account.")
         else:
-            df["payroll_month"] = np.nan
+            st.info(f"No {scope} records in the selected payroll months.")
+        st.stop()
 
-    # -----------------------------
-    # Salary band derivation (Adj. Salary)
-    # -----------------------------
-    if "Adj. Salary" in df.columns:
-        df["Adj. Salary"] = pd.to_numeric(df["Adj. Salary"], errors="coerce").fillna(0)
-    
     # -----------------------------
     # Filters
     # -----------------------------
@@ -196,42 +543,23 @@ def run():
     # -----------------------------
     # APPLY FILTERS
     # -----------------------------
-    f = df.copy()
-
-    if agency != "All" and "Agency" in f.columns:
-        f = f[f["Agency"] == agency]
-
-    if gender != "All" and "Gender" in f.columns:
-        f = f[f["Gender"] == gender]
-
-    if reason != "All" and "Reason" in f.columns:
-        f = f[f["Reason"] == reason]
-
-    if analyst != "All" and "Analyst" in f.columns:
-        f = f[f["Analyst"] == analyst]
-
-    if uploaded_by != "All" and "uploaded_by" in f.columns:
-        f = f[f["uploaded_by"] == uploaded_by]
-
-    if payroll_month != "All" and "payroll_month" in f.columns:
-        f = f[f["payroll_month"] == payroll_month]
-
-    # Bank filter logic
-    if bank_lane == "LRD" and "LRD BANK" in f.columns:
-        if bank_name != "All":
-            f = f[f["LRD BANK"] == bank_name]
-    elif bank_lane == "USD" and "USD BANK" in f.columns:
-        if bank_name != "All":
-            f = f[f["USD BANK"] == bank_name]
-
-    # Salary band filter
-    if salary_band != "All" and "salary_band" in f.columns:
-        f = f[f["salary_band"].astype(str) == salary_band]
-
-    # Date filter
-    if date_filter_on and start_date and end_date:
-        mask = f["uploaded_at"].dt.date.between(start_date, end_date)
-        f = f[mask]
+    filters = {
+        "Agency": agency,
+        "Gender": gender,
+        "Reason": reason,
+        "Analyst": analyst,
+        "uploaded_by": uploaded_by,
+        "payroll_month": payroll_month,
+        "bank_lane": bank_lane,
+        "bank_name": bank_name,
+        "salary_band": salary_band,
+        "date_range": (start_date, end_date) if date_filter_on and start_date and end_date else None,
+    }
+    with perf.span("dashboard.filter"):
+        mask = filter_mask(df, filters)
+        f = df[mask]
+
+    render_export(df, mask)
 
     # -----------------------------
     # Metrics
@@ -248,33 +576,40 @@ def run():
     # -----------------------------
     # Tables + Charts
     # -----------------------------
-    
+    plt, go = _plotting()
 
     st.subheader("Top Adjustments")
-    top = f.sort_values("Difference", ascending=False).head(15)
+    with perf.span("dashboard.agg.top_adjustments"):
+        top = f.nlargest(15, "Difference")
     st.dataframe(top, use_container_width=True)
 
+    render_transaction_browser(df, mask)
+
     st.subheader("Difference by Agency")
-    by_agency = (
-        f.groupby("Agency", as_index=False)["Difference"]
-         .sum()
-         .sort_values("Difference", ascending=False)
-    )
+    with perf.span("dashboard.agg.by_agency"):
+        by_agency = (
+            f.groupby("Agency", as_index=False)["Difference"]
+             .sum()
+             .sort_values("Difference", ascending=False)
+        )
 
-    fig, ax = plt.subplots()
-    ax.bar(by_agency["Agency"], by_agency["Difference"])
-    ax.set_xticklabels(by_agency["Agency"], rotation=45, ha="right")
-    ax.set_ylabel("Difference")
-    st.pyplot(fig)
+    with perf.span("dashboard.chart.by_agency"):
+        fig, ax = plt.subplots()
+        ax.bar(by_agency["Agency"], by_agency["Difference"])
+        ax.set_xticklabels(by_agency["Agency"], rotation=45, ha="right")
+        ax.set_ylabel("Difference")
+        st.pyplot(fig)
 
     st.subheader("Transactions by Reason")
-    by_reason = f["Reason"].value_counts()
+    with perf.span("dashboard.agg.by_reason"):
+        by_reason = f["Reason"].value_counts()
 
-    fig2, ax2 = plt.subplots()
-    ax2.bar(by_reason.index, by_reason.values)
-    ax2.set_xticklabels(by_reason.index, rotation=30, ha="right")
-    ax2.set_ylabel("Count")
-    st.pyplot(fig2)
+    with perf.span("dashboard.chart.by_reason"):
+        fig2, ax2 = plt.subplots()
+        ax2.bar(by_reason.index, by_reason.values)
+        ax2.set_xticklabels(by_reason.index, rotation=30, ha="right")
+        ax2.set_ylabel("Count")
+        st.pyplot(fig2)
 
 
     st.divider()
@@ -287,16 +622,17 @@ def run():
             flow_df[c] = "Unknown"
 
     # aggregate counts
-    flow_agg = (
-        flow_df.groupby(["Agency", "Analyst", "Reason"], dropna=False)
-            .size()
-            .reset_index(name="count")
-    )
+    with perf.span("dashboard.agg.flow"):
+        flow_agg = (
+            flow_df.groupby(["Agency", "Analyst", "Reason"], dropna=False)
+                .size()
+                .reset_index(name="count")
+        )
 
     if flow_agg.empty:
         st.info("No flow data for current filters.")
     else:
-        if PLOTLY_OK:
+        if go is not None:
             # ---- Sankey ----
             agencies = flow_agg["Agency"].astype(str).unique().tolist()
             analysts = flow_agg["Analyst"].astype(str).unique().tolist()
@@ -325,16 +661,17 @@ def run():
             target_an2r = [node_index[x] for x in an2r["Reason"].astype(str)]
             value_an2r  = an2r["count"].tolist()
 
-            sankey_fig = go.Figure(go.Sankey(
-                node=dict(label=nodes),
-                link=dict(
-                    source=source_a2an + source_an2r,
-                    target=target_a2an + target_an2r,
-                    value=value_a2an + value_an2r
-                )
-            ))
-            sankey_fig.update_layout(margin=dict(l=10, r=10, t=10, b=10))
-            st.plotly_chart(sankey_fig, use_container_width=True)
+            with perf.span("dashboard.chart.flow"):
+                sankey_fig = go.Figure(go.Sankey(
+                    node=dict(label=nodes),
+                    link=dict(
+                        source=source_a2an + source_an2r,
+                        target=target_a2an + target_an2r,
+                        value=value_a2an + value_an2r
+                    )
+                ))
+                sankey_fig.update_layout(margin=dict(l=10, r=10, t=10, b=10))
+                st.plotly_chart(sankey_fig, use_container_width=True)
 
         else:
             # ---- Fallback bar chart ----
@@ -344,11 +681,18 @@ def run():
                         .sum()
                         .reset_index()
             )
-            fig3, ax3 = plt.subplots()
-            for ag in bar_agg["Agency"].unique():
-                sub = bar_agg[bar_agg["Agency"] == ag]
-                ax3.bar(sub["Reason"].astype(str), sub["count"], label=str(ag))
-            ax3.set_xticklabels(bar_agg["Reason"].astype(str).unique(), rotation=30, ha="right")
-            ax3.set_ylabel("Count")
-            ax3.legend()
-            st.pyplot(fig3)
+            with perf.span("dashboard.chart.flow"):
+                fig3, ax3 = plt.subplots()
+                for ag in bar_agg["Agency"].unique():
+                    sub = bar_agg[bar_agg["Agency"] == ag]
+                    ax3.bar(sub["Reason"].astype(str), sub["count"], label=str(ag))
+                ax3.set_xticklabels(bar_agg["Reason"].astype(str).unique(), rotation=30, ha="right")
+                ax3.set_ylabel("Count")
+                ax3.legend()
+                st.pyplot(fig3)
+
+    st.divider()
+    render_reconciliation(creds, scope, options)
+
+    st.divider()
+    render_employee_search(creds, scope)
@@ -1,7 +1,64 @@
-from sqlalchemy import create_engine
+from pathlib import Path
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 
 # SQLite DB connection
-engine = create_engine('sqlite:///db/app_data.db')
+DB_PATH = Path("db/app_data.db")
+DB_PATH.parent.mkdir(exist_ok=True)
+
+
+def _set_sqlite_pragmas(dbapi_conn, connection_record):
+    # Let SQLAlchemy emit BEGIN itself (see _begin) instead of pysqlite's
+    # implicit transactions, so BEGIN IMMEDIATE is possible.
+    dbapi_conn.isolation_level = None
+    cursor = dbapi_conn.cursor()
+    # WAL: readers no longer block on a writer (and vice versa).
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # NORMAL is durable in WAL mode except on power loss mid-checkpoint.
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-20000")      # ~20 MB page cache
+    cursor.execute("PRAGMA mmap_size=268435456")    # 256 MB memory-mapped reads
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
+def _begin(conn):
+    conn.exec_driver_sql(conn.get_execution_options().get("sqlite_begin", "BEGIN"))
+
+
+def create_sqlite_engine(path):
+    """Pooled engine for the SQLite file at path, set up like the app's own.
+
+    Connections are reused across Streamlit sessions, so the pragmas and
+    sqlite3's per-connection statement cache (cached_statements) survive
+    between calls.
+    """
+    sqlite_engine = create_engine(
+        f"sqlite:///{Path(path).as_posix()}",
+        poolclass=QueuePool,
+        pool_size=5,
+        max_overflow=10,
+        connect_args={"check_same_thread": False, "timeout": 30, "cached_statements": 256},
+    )
+    event.listen(sqlite_engine, "connect", _set_sqlite_pragmas)
+    event.listen(sqlite_engine, "begin", _begin)
+    return sqlite_engine
+
+
+# One pooled engine for the whole app.
+engine = create_sqlite_engine(DB_PATH)
+
 
 def get_engine():
     return engine
+
+
+
+def begin_immediate():
+    """engine.begin() that takes SQLite's write lock up front (BEGIN IMMEDIATE).
+
+    Use for read-then-write transactions: a plain BEGIN only takes the lock
+    at the first write, so two writers can both read stale values.
+    """
+    return engine.execution_options(sqlite_begin="BEGIN IMMEDIATE").begin()
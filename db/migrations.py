@@ -0,0 +1,438 @@
+import sys
+import time
+import random
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from db.database import get_engine, create_sqlite_engine
+
+# ------------------------------------------------------------
+# Versioned schema migrations.
+#
+# PRAGMA user_version holds the last applied migration. Each migration
+# runs in its own transaction together with the user_version bump, so a
+# failed step leaves the database at the previous version. Steps are SQL
+# strings or callables taking the connection. Append new migrations at
+# the end; never edit one that has shipped.
+# ------------------------------------------------------------
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")')}
+
+
+def _add_columns(table, columns):
+    """Step that adds any of columns missing from older app_data.db files."""
+    def step(conn):
+        existing = _columns(conn, table)
+        for name, decl in columns:
+            if name not in existing:
+                conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN "{name}" {decl}')
+    return step
+
+
+MIGRATIONS = [
+    (1, "baseline schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_name TEXT NOT NULL,
+            middle_name TEXT,
+            last_name TEXT NOT NULL,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL,
+            added_by INTEGER,
+            date TEXT NOT NULL DEFAULT (DATE('now')),
+            time TEXT NOT NULL DEFAULT (TIME('now')),
+            FOREIGN KEY (added_by) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            price REAL NOT NULL,
+            stock INTEGER DEFAULT 0 NOT NULL,
+            user_id INTEGER NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            buyer_name TEXT,
+            contact_info TEXT,
+            receipt_path TEXT,
+            payment_mode TEXT,
+            deleted INTEGER DEFAULT 0,
+            user_id INTEGER,
+            location TEXT NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            receipt_path TEXT,
+            deleted INTEGER DEFAULT 0,
+            user_id INTEGER NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS stock_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            date TEXT NOT NULL DEFAULT (datetime('now')),
+            userid INTEGER,
+            deleted INTEGER DEFAULT 0,
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (userid) REFERENCES users(id)
+        )
+        """,
+        # Databases created by earlier init_db versions lack these columns.
+        _add_columns("products", [("stock", "INTEGER DEFAULT 0 NOT NULL"), ("user_id", "INTEGER NULL")]),
+        _add_columns("purchases", [
+            ("payment_mode", "TEXT NULL"), ("deleted", "INTEGER DEFAULT 0"),
+            ("user_id", "INTEGER NULL"), ("location", "TEXT NULL"),
+        ]),
+        _add_columns("expenses", [
+            ("receipt_path", "TEXT NULL"), ("deleted", "INTEGER DEFAULT 0"), ("user_id", "INTEGER NULL"),
+        ]),
+        _add_columns("stock_entries", [("userid", "INTEGER NULL"), ("deleted", "INTEGER DEFAULT 0")]),
+    ]),
+    (2, "indexes for ordered fetches and product joins", [
+        # fetch_purchases: ORDER BY p.date DESC walks this index backwards.
+        "CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases(date, id)",
+        "CREATE INDEX IF NOT EXISTS idx_purchases_product ON purchases(product_id, date)",
+        # Covers fetch_stock_entries and fetch_stock_trend (id is the rowid,
+        # so it rides along): both are answered from the index alone.
+        "CREATE INDEX IF NOT EXISTS idx_stock_entries_date ON stock_entries(date, product_id, quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_stock_entries_product ON stock_entries(product_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date, id)",
+        # No ANALYZE here: stats taken on a near-empty database mislead the
+        # planner once the tables fill up. See refresh_stats().
+    ]),
+    (3, "daily per-product stock aggregates", [
+        # One row per product per day, kept current by the triggers below
+        # so trend queries scale with days x products, not transactions.
+        """
+        CREATE TABLE IF NOT EXISTS stock_daily (
+            product_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            qty_in INTEGER NOT NULL DEFAULT 0,
+            qty_out INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, day)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stock_entries_daily_insert
+        AFTER INSERT ON stock_entries
+        BEGIN
+            INSERT INTO stock_daily (product_id, day, qty_in)
+            VALUES (NEW.product_id, COALESCE(date(NEW.date), NEW.date), NEW.quantity)
+            ON CONFLICT (product_id, day) DO UPDATE SET qty_in = qty_in + excluded.qty_in;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stock_entries_daily_delete
+        AFTER DELETE ON stock_entries
+        BEGIN
+            UPDATE stock_daily SET qty_in = qty_in - OLD.quantity
+            WHERE product_id = OLD.product_id AND day = COALESCE(date(OLD.date), OLD.date);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_stock_entries_daily_update
+        AFTER UPDATE OF product_id, quantity, date ON stock_entries
+        BEGIN
+            UPDATE stock_daily SET qty_in = qty_in - OLD.quantity
+            WHERE product_id = OLD.product_id AND day = COALESCE(date(OLD.date), OLD.date);
+            INSERT INTO stock_daily (product_id, day, qty_in)
+            VALUES (NEW.product_id, COALESCE(date(NEW.date), NEW.date), NEW.quantity)
+            ON CONFLICT (product_id, day) DO UPDATE SET qty_in = qty_in + excluded.qty_in;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_purchases_daily_insert
+        AFTER INSERT ON purchases
+        BEGIN
+            INSERT INTO stock_daily (product_id, day, qty_out)
+            VALUES (NEW.product_id, COALESCE(date(NEW.date), NEW.date), NEW.quantity)
+            ON CONFLICT (product_id, day) DO UPDATE SET qty_out = qty_out + excluded.qty_out;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_purchases_daily_delete
+        AFTER DELETE ON purchases
+        BEGIN
+            UPDATE stock_daily SET qty_out = qty_out - OLD.quantity
+            WHERE product_id = OLD.product_id AND day = COALESCE(date(OLD.date), OLD.date);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_purchases_daily_update
+        AFTER UPDATE OF product_id, quantity, date ON purchases
+        BEGIN
+            UPDATE stock_daily SET qty_out = qty_out - OLD.quantity
+            WHERE product_id = OLD.product_id AND day = COALESCE(date(OLD.date), OLD.date);
+            INSERT INTO stock_daily (product_id, day, qty_out)
+            VALUES (NEW.product_id, COALESCE(date(NEW.date), NEW.date), NEW.quantity)
+            ON CONFLICT (product_id, day) DO UPDATE SET qty_out = qty_out + excluded.qty_out;
+        END
+        """,
+        # Backfill from existing history.
+        "DELETE FROM stock_daily",
+        """
+        INSERT INTO stock_daily (product_id, day, qty_in)
+        SELECT product_id, COALESCE(date(date), date), SUM(quantity)
+        FROM stock_entries
+        GROUP BY 1, 2
+        """,
+        """
+        INSERT INTO stock_daily (product_id, day, qty_out)
+        SELECT product_id, COALESCE(date(date), date), SUM(quantity)
+        FROM purchases
+        WHERE true
+        GROUP BY 1, 2
+        ON CONFLICT (product_id, day) DO UPDATE SET qty_out = excluded.qty_out
+        """,
+    ]),
+    (4, "agency scope on users", [
+        # NULL agency = unscoped (sees every agency).
+        _add_columns("users", [("agency", "TEXT NULL")]),
+    ]),
+]
+
+
+def current_version(conn):
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(engine=None, target=None):
+    """Applies pending migrations up to target (default: latest). Returns the new version."""
+    engine = engine or get_engine()
+    target = target if target is not None else MIGRATIONS[-1][0]
+
+    with engine.connect() as conn:
+        version = current_version(conn)
+        conn.rollback()
+
+    for number, description, steps in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        # BEGIN IMMEDIATE: two processes starting together must not both
+        # decide the same migration is pending.
+        with engine.execution_options(sqlite_begin="BEGIN IMMEDIATE").begin() as conn:
+            if current_version(conn) >= number:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.exec_driver_sql(step)
+            conn.exec_driver_sql(f"PRAGMA user_version = {int(number)}")
+        print(f"Applied migration {number}: {description}")
+        version = number
+
+    refresh_stats(engine)
+    return version
+
+
+# ------------------------------------------------------------
+# Planner statistics.
+#
+# Stats recorded while a table was tiny make SQLite prefer a product scan
+# plus a temp B-tree sort over the date indexes. refresh_stats() runs at
+# every app start (from migrate()) and re-ANALYZEs each table whose row
+# count has drifted more than STATS_DRIFT-fold from its recorded stats.
+# ------------------------------------------------------------
+STATS_DRIFT = 2
+# Plans over smaller tables are cheap either way. No analysis_limit: a
+# sampled ANALYZE underestimates rows per product_id and brings back the
+# product-first plan.
+STATS_MIN_ROWS = 1000
+
+
+def _recorded_rows(conn):
+    if not conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    ).first():
+        return {}
+    recorded = {}
+    for tbl, stat in conn.exec_driver_sql("SELECT tbl, stat FROM sqlite_stat1"):
+        try:
+            rows = int(str(stat).split()[0])
+        except (ValueError, IndexError):
+            continue
+        recorded[tbl] = max(recorded.get(tbl, 0), rows)
+    return recorded
+
+
+def stale_tables(conn):
+    """Tables whose planner stats are missing or off by more than STATS_DRIFT."""
+    recorded = _recorded_rows(conn)
+    tables = [r[0] for r in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    stale = []
+    for table in tables:
+        actual = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+        known = recorded.get(table)
+        if max(actual, known or 0) < STATS_MIN_ROWS:
+            continue
+        if known is None or actual > known * STATS_DRIFT or actual * STATS_DRIFT < known:
+            stale.append(table)
+    return stale
+
+
+def refresh_stats(engine=None, force=False):
+    """ANALYZEs tables with stale stats (all tables with force). Returns the tables analyzed."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        tables = None if force else stale_tables(conn)
+        if tables == []:
+            return []
+        if tables is None:
+            conn.exec_driver_sql("ANALYZE")
+            return ["*"]
+        for table in tables:
+            conn.exec_driver_sql(f'ANALYZE "{table}"')
+    return tables
+
+
+# ------------------------------------------------------------
+# Benchmark: python -m db.migrations --bench
+# Builds a scratch database with a representative synthetic dataset,
+# refreshes planner stats, then prints the query plan and timing of the
+# hot fetches and checks that the ordered fetches walk their date index
+# instead of sorting. The plans don't depend on what app_data.db holds.
+# ------------------------------------------------------------
+BENCH_ROWS = 100_000
+BENCH_PRODUCTS = 200
+BENCH_DAYS = 730
+
+BENCH_QUERIES = {
+    "fetch_purchases": """
+        SELECT p.id, p.date, pr.name, p.quantity, p.unit_price,
+               p.buyer_name, p.contact_info, p.payment_mode, p.location, p.receipt_path, p.user_id
+        FROM purchases p
+        JOIN products pr ON p.product_id = pr.id
+        ORDER BY p.date DESC
+    """,
+    "fetch_stock_entries": """
+        SELECT s.id, p.name, s.quantity, s.date
+        FROM stock_entries s
+        JOIN products p ON s.product_id = p.id
+        ORDER BY s.date DESC
+    """,
+    "fetch_purchases_page": """
+        SELECT p.id, p.date, pr.name, p.quantity, p.unit_price,
+               p.buyer_name, p.contact_info, p.payment_mode, p.location, p.receipt_path, p.user_id
+        FROM purchases p
+        JOIN products pr ON p.product_id = pr.id
+        WHERE (p.date, p.id) < ('9999-12-31', 0)
+        ORDER BY p.date DESC, p.id DESC LIMIT 500
+    """,
+    "fetch_stock_trend": """
+        SELECT d.day, d.product_id, p.name, d.qty_in, d.qty_out,
+               SUM(d.qty_in - d.qty_out) OVER (PARTITION BY d.product_id ORDER BY d.day)
+        FROM stock_daily d
+        JOIN products p ON d.product_id = p.id
+        ORDER BY d.day
+    """,
+}
+
+
+# Index each ordered fetch must be driven by.
+BENCH_EXPECTED_INDEX = {
+    "fetch_purchases": "idx_purchases_date",
+    "fetch_stock_entries": "idx_stock_entries_date",
+    "fetch_purchases_page": "idx_purchases_date",
+}
+
+
+def _seed_bench(engine, rows=BENCH_ROWS, products=BENCH_PRODUCTS, days=BENCH_DAYS):
+    """Fills a migrated, empty database with synthetic products, purchases and stock entries."""
+    rng = random.Random(0)
+    first_day = date.today() - timedelta(days=days)
+
+    def when():
+        return (first_day + timedelta(days=rng.randrange(days))).isoformat()
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "INSERT INTO products (name, price, stock) VALUES (?, ?, ?)",
+            [(f"Product {i}", round(rng.uniform(1, 500), 2), 1000) for i in range(products)],
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO purchases (date, product_id, quantity, unit_price, buyer_name,"
+            " contact_info, payment_mode, location, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (when(), rng.randint(1, products), rng.randint(1, 20), round(rng.uniform(1, 500), 2),
+                 f"Buyer {rng.randrange(5000)}", "0770000000", rng.choice(["Cash", "Mobile Money"]),
+                 "Monrovia", 1)
+                for _ in range(rows)
+            ],
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO stock_entries (product_id, quantity, date, userid) VALUES (?, ?, ?, ?)",
+            [(rng.randint(1, products), rng.randint(1, 100), when(), 1) for _ in range(rows)],
+        )
+
+
+def bench(engine=None, repeat=5):
+    """Prints plans and timings; raises AssertionError if an ordered fetch sorts.
+
+    Without engine, runs against a scratch database seeded by _seed_bench().
+    """
+    if engine is None:
+        with tempfile.TemporaryDirectory() as scratch:
+            engine = create_sqlite_engine(Path(scratch) / "bench.db")
+            try:
+                migrate(engine)
+                _seed_bench(engine)
+                bench(engine, repeat)
+            finally:
+                engine.dispose()
+        return
+
+    refresh_stats(engine, force=True)
+    failures = []
+    with engine.connect() as conn:
+        print(f"schema version {current_version(conn)}")
+        for name, sql in BENCH_QUERIES.items():
+            plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).fetchall()
+            details = [row[-1] for row in plan]
+            index = BENCH_EXPECTED_INDEX.get(name)
+            if index and (
+                not any(index in d for d in details)
+                or any("TEMP B-TREE FOR ORDER BY" in d for d in details)
+            ):
+                failures.append(f"{name} does not walk {index}: {details}")
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = conn.exec_driver_sql(sql).fetchall()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"\n{name}: {len(rows):,} rows, best of {repeat}: {best * 1000:.2f} ms")
+            for row in plan:
+                print(f"  {row[-1]}")
+    assert not failures, "\n".join(failures)
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        bench()
+    else:
+        migrate()
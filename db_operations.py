@@ -1,79 +1,22 @@
-import sqlite3
-from sqlalchemy import text
+import json
+import base64
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import IntegrityError
 import pandas as pd
-from pathlib import Path
 import hashlib
 import bcrypt
-from datetime import datetime
-from db.database import get_engine
-# Set database path
-DB_PATH = Path("db/app_data.db")
-DB_PATH.parent.mkdir(exist_ok=True)
+from datetime import datetime, date as date_type, timedelta
+from db.database import get_engine, begin_immediate
+from db.migrations import migrate
+from utils import perf, receipt_store
 
-# Connect and create tables if not exist
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Purchases table
-    cursor.execute("""
-        CREATE TABLE IF NOT purchases (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            product_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            unit_price REAL NOT NULL,
-            buyer_name TEXT,
-            contact_info TEXT,
-            receipt_path TEXT,
-            FOREIGN KEY (product_id) REFERENCES products(id)
-    """)
-
-    # Expenses table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS expenses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            category TEXT,
-            amount REAL,
-            description TEXT,
-            receipt TEXT
-        )
-    """)
-
-    # Products table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            price REAL NOT NULL,
-            stock INTEGER DEFAULT 0
-        )
-    """)
+# Every function below borrows a connection from the pooled engine in
+# db.database instead of opening its own sqlite3 connection per call.
 
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS stock_entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER NOT NULL,
-        quantity INTEGER NOT NULL,
-        date TEXT NOT NULL DEFAULT (datetime('now')),
-        FOREIGN KEY (product_id) REFERENCES products(id)
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE stock_entries (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER NOT NULL,
-        quantity INTEGER NOT NULL,
-        date TEXT NOT NULL DEFAULT (datetime('now')),
-        userid INTEGER,
-        FOREIGN KEY (product_id) REFERENCES products(id),
-        FOREIGN KEY (userid) REFERENCES users(id)
-    )
-    """)
-
-    conn.commit()
-    conn.close()
+# Create tables if not exist and bring older databases up to date
+@perf.timed("db.init_db")
+def init_db():
+    return migrate()
 
 # def hash_password(password):
 #     return hashlib.sha256(password.encode()).hexdigest()
@@ -86,6 +29,7 @@ def check_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
+@perf.timed("db.update_user_password")
 def update_user_password(username, old_password, new_password):
     engine = get_engine()
 
@@ -111,166 +55,493 @@ def update_user_password(username, old_password, new_password):
 
 
 # Insert purchase
+@perf.timed("db.insert_purchase")
 def insert_purchase(date, product_id, quantity, unit_price, buyer_name, contact_info, payment_mode, location, receipt_path, user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """Records one purchase and deducts its stock; returns True on success.
+
+    A batch of one: single and batch purchases share insert_purchases'
+    stock reservation, so both deduct products.stock the same way.
+    """
+    result = insert_purchases([{
+        "date": date,
+        "product_id": product_id,
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "buyer_name": buyer_name,
+        "contact_info": contact_info,
+        "payment_mode": payment_mode,
+        "location": location,
+        "receipt_path": receipt_path,
+    }], user_id)[0]
+    if not result["ok"]:
+        print("Purchase failed:", result["error"])
+    return result["ok"]
+
+
+# Insert a batch of purchase lines
+@perf.timed("db.insert_purchases")
+def insert_purchases(lines, user_id):
+    """Records many purchase lines in one transaction and deducts their stock.
+
+    lines are dicts with the insert_purchase fields (date, product_id,
+    quantity, unit_price, buyer_name, contact_info, payment_mode, location,
+    receipt_path). Stock is reserved with one conditional UPDATE per
+    product under BEGIN IMMEDIATE, so concurrent orders cannot oversell.
+    Lines are accepted in order while their product has stock left.
+
+    Returns one {"line", "ok", "error"} dict per input line.
+    """
+    results = [{"line": i, "ok": False, "error": None} for i in range(len(lines))]
+
+    pending = []
+    for i, line in enumerate(lines):
+        if not line.get("location"):
+            results[i]["error"] = "Please enter a delivery location!"
+        elif not line.get("quantity") or line["quantity"] <= 0:
+            results[i]["error"] = "Quantity must be positive"
+        else:
+            pending.append(i)
+
+    if not pending:
+        return results
+
     try:
-        # Check available stock
-        cursor.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
-        result = cursor.fetchone()
-        if result is None:
-            raise ValueError("Product not found")
-        available_stock = result[0]
-
-        if quantity > available_stock:
-            raise ValueError("Not enough stock available")
-
-        if location == "":
-            raise ValueError("Please enter a delivery location!")
-        # Insert purchase
-        cursor.execute('''
-            INSERT INTO purchases (date, product_id, quantity, unit_price, buyer_name, contact_info, payment_mode, location, receipt_path, user_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (date, product_id, quantity, unit_price, buyer_name, contact_info, payment_mode, location, receipt_path, user_id))
-
-        # Deduct stock
-        # cursor.execute("UPDATE products SET stock = stock - ? WHERE id = ?", (quantity, product_id))
-
-        conn.commit()
-        return True
+        # Receipt files are hashed and linked before BEGIN IMMEDIATE, so the
+        # write lock is never held during file I/O.
+        receipts = {i: receipt_store.ingest(lines[i].get("receipt_path")) for i in pending}
+        with begin_immediate() as conn:
+            product_ids = sorted({lines[i]["product_id"] for i in pending})
+            stock = dict(conn.execute(
+                text("SELECT id, stock FROM products WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                {"ids": product_ids}
+            ).fetchall())
+
+            reserved = {}
+            accepted = []
+            for i in pending:
+                product_id, quantity = lines[i]["product_id"], lines[i]["quantity"]
+                if product_id not in stock:
+                    results[i]["error"] = "Product not found"
+                elif reserved.get(product_id, 0) + quantity > stock[product_id]:
+                    results[i]["error"] = "Not enough stock available"
+                else:
+                    reserved[product_id] = reserved.get(product_id, 0) + quantity
+                    accepted.append(i)
+
+            for product_id, total in reserved.items():
+                updated = conn.execute(
+                    text("UPDATE products SET stock = stock - :total WHERE id = :product_id AND stock >= :total"),
+                    {"total": total, "product_id": product_id}
+                ).rowcount
+                if updated != 1:
+                    # Cannot happen while we hold the write lock; bail out rather than oversell.
+                    raise ValueError(f"Stock changed during reservation for product {product_id}")
+
+            if accepted:
+                conn.execute(text("""
+                    INSERT INTO purchases (date, product_id, quantity, unit_price, buyer_name, contact_info, payment_mode, location, receipt_path, user_id)
+                    VALUES (:date, :product_id, :quantity, :unit_price, :buyer_name, :contact_info, :payment_mode, :location, :receipt_path, :user_id)
+                """), [
+                    {
+                        "date": lines[i]["date"],
+                        "product_id": lines[i]["product_id"],
+                        "quantity": lines[i]["quantity"],
+                        "unit_price": lines[i]["unit_price"],
+                        "buyer_name": lines[i].get("buyer_name"),
+                        "contact_info": lines[i].get("contact_info"),
+                        "payment_mode": lines[i].get("payment_mode"),
+                        "location": lines[i]["location"],
+                        "receipt_path": receipts[i],
+                        "user_id": user_id
+                    }
+                    for i in accepted
+                ])
     except Exception as e:
-        print("Purchase failed:", e)
-        return False
-    finally:
-        conn.close()
+        print("Batch purchase failed:", e)
+        for i in pending:
+            results[i]["ok"] = False
+            results[i]["error"] = results[i]["error"] or f"Batch rolled back: {e}"
+        return results
+
+    for i in accepted:
+        results[i]["ok"] = True
+    return results
 
 
 # Insert expense
+@perf.timed("db.insert_expense")
 def insert_expense(date, category, amount, description, receipt_path, user_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO expenses (date, category, amount, description, receipt_path, user_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (date, category, amount, description, receipt_path, user_id))
-    conn.commit()
-    conn.close()
+    receipt_path = receipt_store.ingest(receipt_path)
+    with get_engine().begin() as conn:
+        conn.execute(text("""
+            INSERT INTO expenses (date, category, amount, description, receipt_path, user_id)
+            VALUES (:date, :category, :amount, :description, :receipt_path, :user_id)
+        """), {
+            "date": date,
+            "category": category,
+            "amount": amount,
+            "description": description,
+            "receipt_path": receipt_path,
+            "user_id": user_id
+        })
+
+# Point existing receipt_path values at the content-addressed store
+@perf.timed("db.migrate_receipts_to_store")
+def migrate_receipts_to_store():
+    """Ingests every referenced receipt file and rewrites its path. Returns rows updated."""
+    updated = 0
+    for table in ("purchases", "expenses"):
+        with get_engine().connect() as conn:
+            rows = conn.execute(text(
+                f"SELECT id, receipt_path FROM {table} WHERE receipt_path IS NOT NULL AND receipt_path != ''"
+            )).fetchall()
+
+        # Files are ingested outside any transaction; the UPDATE only
+        # rewrites rows whose path is still the one that was ingested.
+        changes = []
+        for row_id, path in rows:
+            new_path = receipt_store.ingest(path)
+            if new_path != path:
+                changes.append({"id": row_id, "old_path": path, "receipt_path": new_path})
+        if changes:
+            with get_engine().begin() as conn:
+                conn.execute(text(
+                    f"UPDATE {table} SET receipt_path = :receipt_path WHERE id = :id AND receipt_path = :old_path"
+                ), changes)
+            updated += len(changes)
+    return updated
+
 
 # Fetch all purchases
+@perf.timed("db.fetch_purchases")
 def fetch_purchases():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT p.id, p.date, pr.name, p.quantity, p.unit_price,
-               p.buyer_name, p.contact_info, p.payment_mode, p.location, p.receipt_path, p.user_id
-        FROM purchases p
-        JOIN products pr ON p.product_id = pr.id
-        ORDER BY p.date DESC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    with get_engine().connect() as conn:
+        rows = conn.execute(text("""
+            SELECT p.id, p.date, pr.name, p.quantity, p.unit_price,
+                   p.buyer_name, p.contact_info, p.payment_mode, p.location, p.receipt_path, p.user_id
+            FROM purchases p
+            JOIN products pr ON p.product_id = pr.id
+            ORDER BY p.date DESC
+        """)).fetchall()
     return rows
 
 
 # Fetch all expenses
+@perf.timed("db.fetch_expenses")
 def fetch_expenses():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM expenses')
-    records = cursor.fetchall()
-    conn.close()
+    with get_engine().connect() as conn:
+        records = conn.execute(text('SELECT * FROM expenses')).fetchall()
     return records
 
+# ------------------------------------------------------------
+# Keyset pagination
+#
+# Pages are ordered newest first by (date, id) and resume *after* the
+# last row of the previous page, so page N costs the same as page 1 and
+# memory stays at one page. The resume token is opaque to callers.
+# ------------------------------------------------------------
+PAGE_SIZE = 500
+
+
+def _encode_token(row):
+    key = json.dumps([row._mapping["date"], row._mapping["id"]])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def _decode_token(token):
+    try:
+        after_date, after_id = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return str(after_date), int(after_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page token.")
+
+
+def _day_after(value):
+    # datetime is a date subclass; its isoformat() would keep the time.
+    if isinstance(value, datetime):
+        day = value.date()
+    elif isinstance(value, date_type):
+        day = value
+    else:
+        day = date_type.fromisoformat(str(value)[:10])
+    return (day + timedelta(days=1)).isoformat()
+
+
+def _fetch_page(select_sql, date_col, id_col, filters, page_size, token):
+    """Runs one page of select_sql; filters is a list of (clause, params) pairs."""
+    clauses, params = [], {}
+    for clause, values in filters:
+        clauses.append(clause)
+        params.update(values)
+    if token:
+        after_date, after_id = _decode_token(token)
+        clauses.append(f"({date_col}, {id_col}) < (:after_date, :after_id)")
+        params.update({"after_date": after_date, "after_id": after_id})
+
+    query = select_sql
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += f" ORDER BY {date_col} DESC, {id_col} DESC LIMIT :limit"
+    params["limit"] = page_size
+
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(query), params).fetchall()
+
+    next_token = _encode_token(rows[-1]) if len(rows) == page_size else None
+    return rows, next_token
+
+
+def _range_filters(date_col, start_date, end_date):
+    filters = []
+    if start_date:
+        filters.append((f"{date_col} >= :start_date", {"start_date": str(start_date)}))
+    if end_date:
+        # Dates may carry a time part; compare against the next day so
+        # end_date is inclusive and the date index stays usable.
+        filters.append((f"{date_col} < :end_before", {"end_before": _day_after(end_date)}))
+    return filters
+
+
+def _iter_pages(fetch_page, token=None, **kwargs):
+    while True:
+        rows, token = fetch_page(token=token, **kwargs)
+        yield from rows
+        if token is None:
+            return
+
+
+@perf.timed("db.fetch_purchases_page")
+def fetch_purchases_page(start_date=None, end_date=None, product_id=None, user_id=None,
+                         page_size=PAGE_SIZE, token=None):
+    """One page of purchases, newest first. Returns (rows, next_token); next_token is None on the last page."""
+    filters = _range_filters("p.date", start_date, end_date)
+    if product_id is not None:
+        filters.append(("p.product_id = :product_id", {"product_id": product_id}))
+    if user_id is not None:
+        filters.append(("p.user_id = :user_id", {"user_id": user_id}))
+    return _fetch_page("""
+        SELECT p.id, p.date, pr.name, p.quantity, p.unit_price,
+               p.buyer_name, p.contact_info, p.payment_mode, p.location, p.receipt_path, p.user_id
+        FROM purchases p
+        JOIN products pr ON p.product_id = pr.id
+    """, "p.date", "p.id", filters, page_size, token)
+
+
+def iter_purchases(page_size=PAGE_SIZE, token=None, **filters):
+    """Yields every matching purchase, fetching page_size rows at a time."""
+    return _iter_pages(fetch_purchases_page, token=token, page_size=page_size, **filters)
+
+
+@perf.timed("db.fetch_expenses_page")
+def fetch_expenses_page(start_date=None, end_date=None, category=None, user_id=None,
+                        page_size=PAGE_SIZE, token=None):
+    """One page of expenses, newest first. Returns (rows, next_token)."""
+    filters = _range_filters("date", start_date, end_date)
+    if category is not None:
+        filters.append(("category = :category", {"category": category}))
+    if user_id is not None:
+        filters.append(("user_id = :user_id", {"user_id": user_id}))
+    return _fetch_page("SELECT * FROM expenses", "date", "id", filters, page_size, token)
+
+
+def iter_expenses(page_size=PAGE_SIZE, token=None, **filters):
+    return _iter_pages(fetch_expenses_page, token=token, page_size=page_size, **filters)
+
+
+@perf.timed("db.fetch_stock_entries_page")
+def fetch_stock_entries_page(start_date=None, end_date=None, product_id=None, user_id=None,
+                             page_size=PAGE_SIZE, token=None):
+    """One page of stock entries, newest first. Returns (rows, next_token)."""
+    filters = _range_filters("s.date", start_date, end_date)
+    if product_id is not None:
+        filters.append(("s.product_id = :product_id", {"product_id": product_id}))
+    if user_id is not None:
+        filters.append(("s.userid = :user_id", {"user_id": user_id}))
+    return _fetch_page("""
+        SELECT s.id, p.name, s.quantity, s.date
+        FROM stock_entries s
+        JOIN products p ON s.product_id = p.id
+    """, "s.date", "s.id", filters, page_size, token)
+
+
+def iter_stock_entries(page_size=PAGE_SIZE, token=None, **filters):
+    return _iter_pages(fetch_stock_entries_page, token=token, page_size=page_size, **filters)
+
 # Fetch list of Products
+@perf.timed("db.fetch_products")
 def fetch_products():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, price, stock FROM products")
-    products = cursor.fetchall()
-    conn.close()
+    with get_engine().connect() as conn:
+        products = conn.execute(text("SELECT id, name, price, stock FROM products")).fetchall()
     return products
 
 
 
+@perf.timed("db.add_product")
 def add_product(name, price, user_id, stock=0):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO products (name, price, user_id, stock) VALUES (?, ?, ?, ?)", (name, price, user_id, stock))
-        conn.commit()
+        with get_engine().begin() as conn:
+            conn.execute(
+                text("INSERT INTO products (name, price, user_id, stock) VALUES (:name, :price, :user_id, :stock)"),
+                {"name": name, "price": price, "user_id": user_id, "stock": stock}
+            )
         return True
-    except sqlite3.IntegrityError:
+    except IntegrityError:
         return False
-    finally:
-        conn.close()
 
 
+@perf.timed("db.update_product")
 def update_product(product_id, name, price, stock):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE products SET name = ?, price = ?, stock = ? WHERE id = ?", (name, price, stock, product_id))
-    conn.commit()
-    conn.close()
+    with get_engine().begin() as conn:
+        conn.execute(
+            text("UPDATE products SET name = :name, price = :price, stock = :stock WHERE id = :product_id"),
+            {"name": name, "price": price, "stock": stock, "product_id": product_id}
+        )
 
 
+@perf.timed("db.delete_product")
 def delete_product(product_id):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-    conn.commit()
-    conn.close()
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM products WHERE id = :product_id"), {"product_id": product_id})
 
+@perf.timed("db.add_stock_entry")
 def add_stock_entry(product_id, quantity, userid, date=None):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     try:
-        if date:
-            cursor.execute(
-                "INSERT INTO stock_entries (product_id, quantity, date, userid) VALUES (?, ?, ?, ?)",
-                (product_id, quantity, date, userid)
+        with get_engine().begin() as conn:
+            if date:
+                conn.execute(
+                    text("INSERT INTO stock_entries (product_id, quantity, date, userid) VALUES (:product_id, :quantity, :date, :userid)"),
+                    {"product_id": product_id, "quantity": quantity, "date": date, "userid": userid}
+                )
+            else:
+                conn.execute(
+                    text("INSERT INTO stock_entries (product_id, quantity, userid) VALUES (:product_id, :quantity, :userid)"),
+                    {"product_id": product_id, "quantity": quantity, "userid": userid}
+                )
+
+            conn.execute(
+                text("UPDATE products SET stock = stock + :quantity WHERE id = :product_id"),
+                {"quantity": quantity, "product_id": product_id}
             )
+    except Exception as e:
+        print(f"Error adding stock entry: {e}")
+
+@perf.timed("db.add_stock_entries")
+def add_stock_entries(entries, userid):
+    """Restocks many products in one transaction.
+
+    entries are dicts with product_id, quantity and an optional date.
+    Entries are inserted with executemany and stock is raised with one
+    UPDATE per product. Returns one {"line", "ok", "error"} dict per entry.
+    """
+    results = [{"line": i, "ok": False, "error": None} for i in range(len(entries))]
+    valid = []
+    for i, entry in enumerate(entries):
+        if not entry.get("quantity") or entry["quantity"] <= 0:
+            results[i]["error"] = "Quantity must be positive"
         else:
-            cursor.execute(
-                "INSERT INTO stock_entries (product_id, quantity, userid) VALUES (?, ?, ?)",
-                (product_id, quantity, userid)
-            )
+            valid.append(i)
 
-        cursor.execute(
-            "UPDATE products SET stock = stock + ? WHERE id = ?",
-            (quantity, product_id)
-        )
-        conn.commit()
+    if not valid:
+        return results
+
+    try:
+        with begin_immediate() as conn:
+            product_ids = sorted({entries[i]["product_id"] for i in valid})
+            known = {row[0] for row in conn.execute(
+                text("SELECT id FROM products WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                {"ids": product_ids}
+            )}
+
+            accepted, totals = [], {}
+            for i in valid:
+                product_id = entries[i]["product_id"]
+                if product_id not in known:
+                    results[i]["error"] = "Product not found"
+                    continue
+                accepted.append(i)
+                totals[product_id] = totals.get(product_id, 0) + entries[i]["quantity"]
+
+            if accepted:
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                conn.execute(
+                    text("INSERT INTO stock_entries (product_id, quantity, date, userid) VALUES (:product_id, :quantity, :date, :userid)"),
+                    [
+                        {
+                            "product_id": entries[i]["product_id"],
+                            "quantity": entries[i]["quantity"],
+                            "date": entries[i].get("date") or now,
+                            "userid": userid
+                        }
+                        for i in accepted
+                    ]
+                )
+                conn.execute(
+                    text("UPDATE products SET stock = stock + :quantity WHERE id = :product_id"),
+                    [{"quantity": total, "product_id": product_id} for product_id, total in totals.items()]
+                )
     except Exception as e:
-        print(f"Error adding stock entry: {e}")
-    finally:
-        conn.close()
+        print(f"Error adding stock entries: {e}")
+        for i in valid:
+            results[i]["ok"] = False
+            results[i]["error"] = results[i]["error"] or f"Batch rolled back: {e}"
+        return results
 
+    for i in accepted:
+        results[i]["ok"] = True
+    return results
+
+@perf.timed("db.fetch_stock_entries")
 def fetch_stock_entries():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT s.id, p.name, s.quantity, s.date
-            FROM stock_entries s
-            JOIN products p ON s.product_id = p.id
-            ORDER BY s.date DESC
-        """)
-        entries = cursor.fetchall()
+        with get_engine().connect() as conn:
+            entries = conn.execute(text("""
+                SELECT s.id, p.name, s.quantity, s.date
+                FROM stock_entries s
+                JOIN products p ON s.product_id = p.id
+                ORDER BY s.date DESC
+            """)).fetchall()
         return entries
     except Exception as e:
         print(f"Error fetching stock entries: {e}")
         return []
-    finally:
-        conn.close()
 
-def fetch_stock_trend():
-    engine = get_engine()
-    query = text("""
-        SELECT s.date, s.product_id, p.name AS product_name, s.quantity
-        FROM stock_entries s
-        JOIN products p ON s.product_id = p.id
-        ORDER BY s.date
+@perf.timed("db.fetch_stock_trend")
+def fetch_stock_trend(product_id=None, start_date=None, end_date=None):
+    """Daily stock in/out per product with the cumulative net movement.
+
+    Reads the stock_daily rollup maintained by triggers (migration 3).
+    net_movement is the running sum of stock entries minus purchases
+    since the first recorded day; it is computed over the full history
+    before the date range is applied, so it is correct for any window.
+
+    It is not the stock level: products.stock also reflects values set
+    through add_product/update_product.
+    """
+    filters, params = [], {}
+    if product_id is not None:
+        filters.append("t.product_id = :product_id")
+        params["product_id"] = product_id
+    if start_date:
+        filters.append("t.date >= :start_date")
+        params["start_date"] = str(start_date)[:10]
+    if end_date:
+        filters.append("t.date <= :end_date")
+        params["end_date"] = str(end_date)[:10]
+    where = ("WHERE " + " AND ".join(filters)) if filters else ""
+
+    query = text(f"""
+        SELECT t.date, t.product_id, p.name AS product_name, t.quantity, t.qty_out, t.net_movement
+        FROM (
+            SELECT d.day AS date, d.product_id, d.qty_in AS quantity, d.qty_out,
+                   SUM(d.qty_in - d.qty_out) OVER (
+                       PARTITION BY d.product_id ORDER BY d.day
+                   ) AS net_movement
+            FROM stock_daily d
+        ) t
+        JOIN products p ON t.product_id = p.id
+        {where}
+        ORDER BY t.date
     """)
-    with engine.connect() as conn:
-        df = pd.read_sql(query, conn)
-    return df
\ No newline at end of file
+    with get_engine().connect() as conn:
+        df = pd.read_sql(query, conn, params=params)
+    return df
@@ -0,0 +1,44 @@
+import streamlit as st
+import pandas as pd
+from utils import perf, warmup
+
+
+def run():
+    st.title("⏱️ Performance")
+    st.caption("Timings for this server process, from the last "
+               f"{perf.RING_SIZE:,} calls of each instrumented code path.")
+
+    startup = warmup.report()
+    if startup:
+        st.subheader("Startup")
+        st.dataframe(
+            pd.DataFrame({"event": list(startup), "seconds since server start": [round(v, 2) for v in startup.values()]}),
+            use_container_width=True, hide_index=True,
+        )
+        st.subheader("Code paths")
+
+    rows = perf.snapshot()
+    if not rows:
+        st.info("No timings recorded yet. Open the dashboard or log in to collect some.")
+        return
+
+    stats = pd.DataFrame(rows)
+    for col in ["mean", "p50", "p90", "p99", "max"]:
+        stats[col] = (stats[col] * 1000).round(1)
+    stats = stats.rename(columns={c: f"{c} (ms)" for c in ["mean", "p50", "p90", "p99", "max"]})
+
+    st.dataframe(stats.sort_values("p90 (ms)", ascending=False), use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    if col1.button("💾 Export Prometheus file"):
+        try:
+            path = perf.export_prometheus()
+            st.success(f"Metrics written to {path}")
+        except OSError as e:
+            st.error(f"❌ Export failed: {e}")
+    if col2.button("🧹 Reset timings"):
+        perf.reset()
+        st.rerun()
+
+    with st.expander("Prometheus text format"):
+        st.code(perf.to_prometheus(), language="text")
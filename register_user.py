@@ -1,10 +1,24 @@
 import streamlit as st
+import pandas as pd
 # from db_operations import insert_user  # Make sure this is correctly imported
-from auth import register_user
+from auth import register_user, bulk_register_users, USER_ROLES, DEFAULT_ROLE, BULK_REQUIRED_FIELDS
+from dashboard import known_agencies
+
+BULK_COLUMNS = ["first_name", "middle_name", "last_name", "username", "password", "role", "agency"]
+ALL_AGENCIES = "All agencies"
 
-st.title("👤 Register a New User")
 
 def run():
+    st.title("👤 Register a New User")
+
+    single_tab, bulk_tab = st.tabs(["Single user", "Bulk import"])
+    with single_tab:
+        render_single_form()
+    with bulk_tab:
+        render_bulk_import()
+
+
+def render_single_form():
     # --- Registration Form ---
     with st.form("register_form", clear_on_submit=True):
         col1, col2 = st.columns(2)
@@ -14,7 +28,11 @@ def run():
             username = st.text_input("Username", max_chars=50)
         with col2:
             last_name = st.text_input("Last Name", max_chars=50)
-            role = st.selectbox("User Role", ["Admin", "Staff", "Viewer"])
+            role = st.selectbox("User Role", USER_ROLES)
+            agency = st.selectbox(
+                "Agency", [ALL_AGENCIES] + known_agencies(),
+                help="Limits the user to one agency's records. Agencies come from the payroll data.",
+            )
 
         password = st.text_input("Password", type="password")
         confirm_password = st.text_input("Confirm Password", type="password")
@@ -30,10 +48,72 @@ def run():
                 st.error("🚫 Passwords do not match.")
             else:
                 try:
-                    register_user(
+                    ok = register_user(
                         first_name, middle_name, last_name,
-                        username, password, role
+                        username, password, role, None if agency == ALL_AGENCIES else agency
                     )
-                    st.success(f"✅ User '{username}' registered successfully.")
+                    if ok:
+                        st.success(f"✅ User '{username}' registered successfully.")
+                    else:
+                        st.error("❌ Registration failed. The username may already be taken.")
                 except Exception as e:
                     st.error(f"❌ Registration failed: {e}")
+
+
+def _read_user_file(uploaded):
+    if uploaded.name.endswith(".csv"):
+        df = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(uploaded, dtype=str).fillna("")
+    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+    return df
+
+
+def render_bulk_import():
+    agencies = known_agencies()
+    st.caption(
+        "Upload a CSV or Excel file with columns: " + ", ".join(BULK_COLUMNS)
+        + f". Required: {', '.join(BULK_REQUIRED_FIELDS)}. Role is one of {', '.join(USER_ROLES)}"
+        + f" (default {DEFAULT_ROLE});"
+        " a blank agency gives access to all agencies, otherwise it must be one of: "
+        + (", ".join(agencies) or "none yet — no payroll data has been loaded")
+        + "."
+    )
+    uploaded = st.file_uploader("User list", type=["csv", "xlsx", "xls"], key="bulk_users_file")
+    if not uploaded:
+        return
+
+    try:
+        df = _read_user_file(uploaded)
+    except Exception as e:
+        st.error(f"❌ Could not read the file: {e}")
+        return
+
+    missing = [c for c in BULK_REQUIRED_FIELDS if c not in df.columns]
+    if missing:
+        st.error(f"❌ Missing column(s): {', '.join(missing)}")
+        return
+
+    st.write(f"{len(df):,} users in file.")
+    st.dataframe(df.drop(columns="password").head(20), use_container_width=True)
+
+    if st.button("Register all", key="bulk_users_submit"):
+        rows = df.reindex(columns=BULK_COLUMNS, fill_value="").to_dict("records")
+        with st.spinner(f"Registering {len(rows):,} users..."):
+            results = bulk_register_users(rows, agencies=agencies)
+
+        report = pd.DataFrame(results)
+        # Row numbers as they appear in the spreadsheet (header is row 1).
+        report["row"] = report["row"] + 2
+        report["status"] = report["ok"].map({True: "registered", False: "rejected"})
+        created = int(report["ok"].sum())
+        if created:
+            st.success(f"✅ Registered {created:,} of {len(report):,} users.")
+        if created < len(report):
+            st.warning(f"⚠️ {len(report) - created:,} rows were not registered; see the report below.")
+        report = report[["row", "username", "status", "error"]]
+        st.dataframe(report, use_container_width=True, hide_index=True)
+        st.download_button(
+            "Download report (CSV)", report.to_csv(index=False).encode("utf-8"),
+            file_name="user_import_report.csv", mime="text/csv",
+        )
@@ -0,0 +1,161 @@
+import re
+import difflib
+import numpy as np
+import pandas as pd
+
+
+# ------------------------------------------------------------
+# Employee search index over the prepared master data.
+#
+# Built once per data version:
+#   - sorted Employee IDs and sorted name tokens, for prefix lookups by
+#     binary search;
+#   - a trigram -> employees inverted index, for typo-tolerant matches;
+#   - Employee ID -> row positions, for the full transaction history.
+# ------------------------------------------------------------
+ID_COL = "Employee ID"
+NAME_COLS = ["First Name", "Middle Name", "Last Name"]
+MIN_SIMILARITY = 0.3
+
+_WORD = re.compile(r"[^\w]+")
+
+
+def _normalize(value):
+    return _WORD.sub(" ", str(value).lower()).strip()
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def build_index(df):
+    """Returns the search index (a dict) for df; see search() and history()."""
+    if ID_COL not in df.columns:
+        raise ValueError(f"Master data has no '{ID_COL}' column.")
+
+    stripped = df[ID_COL].astype(str).str.strip()
+    # Rows without an ID are not searchable; astype(str) alone would index
+    # them all as one "nan" employee.
+    has_id = (df[ID_COL].notna() & (stripped != "")).to_numpy(dtype=bool)
+    ids = stripped.to_numpy(dtype=object)
+    ids[~has_id] = None
+    # Row positions grouped by employee: codes sorted once, sliced per lookup.
+    # ID-less rows get code -1 and sort before every employee.
+    codes, uniques = pd.factorize(ids)
+    rows_order = np.argsort(codes, kind="stable")
+    rows_bounds = np.searchsorted(codes[rows_order], np.arange(len(uniques) + 1))
+
+    # Latest row per employee supplies the displayed name and agency.
+    order = df["uploaded_at"].argsort(kind="stable").to_numpy() if "uploaded_at" in df.columns else np.arange(len(df))
+    order = order[has_id[order]]
+    latest = df.iloc[order].assign(**{ID_COL: ids[order]}).drop_duplicates(ID_COL, keep="last")
+
+    names = pd.Series("", index=latest.index)
+    for col in NAME_COLS:
+        if col in latest.columns:
+            names = names + " " + latest[col].fillna("").astype(str)
+    employees = pd.DataFrame({
+        ID_COL: latest[ID_COL].to_numpy(),
+        "Name": names.str.split().str.join(" ").to_numpy(),
+        "Agency": latest["Agency"].to_numpy() if "Agency" in latest.columns else "",
+    })
+    normalized = [_normalize(n) for n in employees["Name"]]
+
+    id_keys = employees[ID_COL].str.lower().to_numpy()
+    id_order = np.argsort(id_keys, kind="stable")
+
+    tokens, token_owner = [], []
+    postings = {}
+    for i, (emp_id, name) in enumerate(zip(id_keys, normalized)):
+        for token in name.split():
+            tokens.append(token)
+            token_owner.append(i)
+        for tri in _trigrams(name) | _trigrams(emp_id):
+            postings.setdefault(tri, []).append(i)
+    token_keys = np.array(tokens, dtype=object)
+    token_order = np.argsort(token_keys, kind="stable") if len(tokens) else np.array([], dtype=int)
+
+    return {
+        "employees": employees,
+        "normalized": normalized,
+        "id_sorted": id_keys[id_order],
+        "id_order": id_order,
+        "token_sorted": token_keys[token_order],
+        "token_owner": np.array(token_owner, dtype=int)[token_order],
+        "postings": {tri: np.array(v, dtype=np.int32) for tri, v in postings.items()},
+        "id_codes": pd.Index(uniques),
+        "rows_order": rows_order,
+        "rows_bounds": rows_bounds,
+    }
+
+
+def _prefix_range(sorted_keys, prefix):
+    lo = np.searchsorted(sorted_keys, prefix, side="left")
+    hi = np.searchsorted(sorted_keys, prefix + "\uffff", side="left")
+    return lo, hi
+
+
+def search(index, query, limit=20):
+    """Ranked matches for an Employee ID or (partial, misspelt) name."""
+    q = _normalize(query)
+    if not q:
+        return index["employees"].iloc[0:0].assign(score=[])
+
+    n = len(index["employees"])
+    scores = np.zeros(n)
+
+    # 1. Employee ID: exact, then prefix.
+    q_id = str(query).strip().lower()
+    lo, hi = _prefix_range(index["id_sorted"], q_id)
+    hits = index["id_order"][lo:hi]
+    scores[hits] = 90.0
+    scores[hits[index["id_sorted"][lo:hi] == q_id]] = 100.0
+
+    # 2. Every query word is a prefix of some name part.
+    words = q.split()
+    word_hits = None
+    for word in words:
+        lo, hi = _prefix_range(index["token_sorted"], word)
+        owners = set(index["token_owner"][lo:hi].tolist())
+        word_hits = owners if word_hits is None else word_hits & owners
+    if word_hits:
+        owners = np.fromiter(word_hits, dtype=int)
+        scores[owners] = np.maximum(scores[owners], 80.0)
+
+    # 3. Trigram overlap, for typos.
+    q_tris = _trigrams(q)
+    lists = [index["postings"][t] for t in q_tris if t in index["postings"]]
+    if lists:
+        shared = np.bincount(np.concatenate(lists), minlength=n)
+        similarity = shared / len(q_tris)
+        fuzzy = np.flatnonzero((similarity >= MIN_SIMILARITY) & (scores == 0))
+        scores[fuzzy] = 50.0 * similarity[fuzzy]
+
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) == 0:
+        return index["employees"].iloc[0:0].assign(score=[])
+
+    # Tie-break the best candidates by edit similarity to the full name.
+    top = candidates[np.argsort(-scores[candidates], kind="stable")[: limit * 5]]
+    refined = np.array([
+        scores[i] + 10.0 * difflib.SequenceMatcher(None, q, index["normalized"][i]).ratio()
+        for i in top
+    ])
+    best = top[np.argsort(-refined, kind="stable")[:limit]]
+    result = index["employees"].iloc[best].copy()
+    result["score"] = np.sort(refined)[::-1][:limit].round(1)
+    return result.reset_index(drop=True)
+
+
+def history(index, df, employee_id):
+    """All master rows for employee_id, oldest upload first."""
+    try:
+        code = index["id_codes"].get_loc(str(employee_id).strip())
+    except KeyError:
+        return df.iloc[0:0]
+    lo, hi = index["rows_bounds"][code], index["rows_bounds"][code + 1]
+    found = df.iloc[index["rows_order"][lo:hi]]
+    if "uploaded_at" in found.columns:
+        found = found.sort_values("uploaded_at", kind="stable")
+    return found
@@ -0,0 +1,161 @@
+import os
+import time
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# ------------------------------------------------------------
+# Chunked export of a filtered view.
+#
+# Rows are selected by position and written CHUNK_ROWS at a time to a
+# spool file on disk, so neither the filtered frame nor the encoded
+# output is ever held in memory whole.
+# ------------------------------------------------------------
+EXPORT_DIR = Path(os.environ.get("DDGHRMP_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "ddghrmp_exports")))
+CHUNK_ROWS = 50_000
+MAX_AGE_SECONDS = 3600
+
+# Excel: 1,048,576 rows per sheet including the header; longer exports
+# continue on "Export (2)", "Export (3)", ... openpyxl writes roughly
+# 5-10k rows a second, so large extracts are steered to CSV / Parquet
+# and XLSX is written in smaller chunks to report progress more often.
+XLSX_MAX_ROWS = 1_048_576
+XLSX_CHUNK_ROWS = 10_000
+XLSX_SUGGEST_ROWS = 50_000
+
+FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+    "Excel (XLSX)": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def iter_chunks(df, positions, chunk_rows=CHUNK_ROWS):
+    if len(positions) == 0:
+        # Still write the header / schema.
+        yield df.iloc[0:0]
+        return
+    for start in range(0, len(positions), chunk_rows):
+        yield df.iloc[positions[start:start + chunk_rows]]
+
+
+def _write_csv(chunks, path):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=(i == 0))
+
+
+def _arrow_ready(chunk):
+    chunk = chunk.copy(deep=False)
+    for col in chunk.columns:
+        if chunk[col].dtype == object or isinstance(chunk[col].dtype, pd.CategoricalDtype):
+            chunk[col] = chunk[col].astype("string")
+    return chunk
+
+
+def _write_parquet(chunks, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(_arrow_ready(chunk), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(str(path), table.schema, compression="snappy")
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _xlsx_value(value):
+    if value is None or value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_xlsx(chunks, path, max_rows=XLSX_MAX_ROWS):
+    from openpyxl import Workbook
+
+    # write_only streams rows to disk instead of building the sheet in memory.
+    wb = Workbook(write_only=True)
+    ws, header, sheet_rows = None, None, 0
+    for chunk in chunks:
+        if header is None:
+            header = [str(c) for c in chunk.columns]
+        if ws is None:
+            ws = wb.create_sheet("Export")
+            ws.append(header)
+            sheet_rows = 1
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet_rows >= max_rows:
+                ws = wb.create_sheet(f"Export ({len(wb.worksheets) + 1})")
+                ws.append(header)
+                sheet_rows = 1
+            ws.append([_xlsx_value(v) for v in row])
+            sheet_rows += 1
+    wb.save(path)
+
+
+_WRITERS = {"CSV": _write_csv, "Parquet": _write_parquet, "Excel (XLSX)": _write_xlsx}
+
+
+def _prune_old_exports():
+    cutoff = time.time() - MAX_AGE_SECONDS
+    for old in EXPORT_DIR.glob("export_*"):
+        try:
+            if old.stat().st_mtime < cutoff:
+                old.unlink()
+        except OSError:
+            pass
+
+
+def _reporting(chunks, total, progress):
+    done = 0
+    for chunk in chunks:
+        yield chunk
+        done += len(chunk)
+        progress(min(1.0, done / total) if total else 1.0)
+
+
+def export(df, mask, fmt, chunk_rows=None, progress=None):
+    """Writes the rows of df selected by mask to a spool file; returns its path.
+
+    progress, if given, is called with the fraction of rows written after
+    each chunk. Callers delete the file once it has been served (stale
+    files are pruned after MAX_AGE_SECONDS anyway).
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    _prune_old_exports()
+
+    suffix = FORMATS[fmt][0]
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=suffix, dir=EXPORT_DIR)
+    os.close(fd)
+
+    if chunk_rows is None:
+        chunk_rows = XLSX_CHUNK_ROWS if fmt == "Excel (XLSX)" else CHUNK_ROWS
+    positions = np.flatnonzero(mask)
+    chunks = iter_chunks(df, positions, chunk_rows)
+    if progress is not None:
+        chunks = _reporting(chunks, len(positions), progress)
+    try:
+        _WRITERS[fmt](chunks, path)
+    except Exception:
+        os.unlink(path)
+        raise
+    return Path(path)
@@ -2,11 +2,11 @@ import os
 import io
 import pandas as pd
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-import gspread
+from utils import perf, sheet_shards
+
+# The Google client libraries are imported inside the functions that use
+# them: googleapiclient alone takes seconds to import, and the login page
+# never needs it.
 
 # ------------------------------------------------------------
 # 1. OAUTH CREDS (Drive + Sheets + Offline refresh token)
@@ -18,6 +18,8 @@ SCOPES = [
 
 
 def get_oauth_creds():
+    from google.oauth2.credentials import Credentials
+
     token_path = "token.json"
 
     # If token exists → reuse it
@@ -25,6 +27,8 @@ def get_oauth_creds():
         return Credentials.from_authorized_user_file(token_path, SCOPES)
 
     # Otherwise → authenticate fresh
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
     flow = InstalledAppFlow.from_client_secrets_file(
         "client_secrets.json", SCOPES
     )
@@ -46,13 +50,18 @@ def get_oauth_creds():
 # 2. GET DRIVE SERVICE (uses SAME creds as Sheets)
 # ------------------------------------------------------------
 def get_drive_service(creds):
+    from googleapiclient.discovery import build
+
     return build("drive", "v3", credentials=creds)
 
 
 # ------------------------------------------------------------
 # 3. UPLOAD FILE TO GOOGLE DRIVE FOLDER
 # ------------------------------------------------------------
+@perf.timed("gdrive.upload_to_drive_folder")
 def upload_to_drive_folder(drive_service, file_bytes, filename, folder_id):
+    from googleapiclient.http import MediaIoBaseUpload
+
     media = MediaIoBaseUpload(
         io.BytesIO(file_bytes),
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
@@ -86,13 +95,24 @@ def upload_to_drive_folder(drive_service, file_bytes, filename, folder_id):
 
 #     return len(rows)
 
-def append_df_to_gsheet(creds, sheet_id, worksheet_name, df):
+@perf.timed("gsheet.append_df_to_gsheet")
+def append_df_to_gsheet(creds, sheet_id, worksheet_name, df, shard_by_month=True):
+    """Appends df to worksheet_name; returns the number of rows appended.
+
+    With shard_by_month the rows go to one worksheet per payroll month
+    (see utils/sheet_shards.py) instead of worksheet_name itself.
+    """
+    import gspread
+
     gc = gspread.authorize(creds)
+    if shard_by_month:
+        return sheet_shards.append_sharded(gc, sheet_id, worksheet_name, df)
+
     ws = gc.open_by_key(sheet_id).worksheet(worksheet_name)
 
-    existing = ws.get_all_values()
-    if len(existing) == 0:
+    if not ws.row_values(1):
         ws.append_row(df.columns.tolist(), value_input_option="USER_ENTERED")
 
     ws.append_rows(df.fillna("").astype(str).values.tolist(),
-                   value_input_option="USER_ENTERED")
\ No newline at end of file
+                   value_input_option="USER_ENTERED")
+    return len(df)
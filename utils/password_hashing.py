@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+# ------------------------------------------------------------
+# bcrypt hashing for one password or a whole batch.
+#
+# Batches are spread over a thread pool: bcrypt releases the GIL while
+# it hashes, so threads use every core without starting new processes.
+# A process pool would re-run the Streamlit script in every worker
+# (Streamlit installs app.py as __main__, which spawn re-imports).
+# ------------------------------------------------------------
+HASH_WORKERS = int(os.environ.get("DDGHRMP_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Below this many passwords the pool start-up costs more than it saves.
+MIN_POOL_BATCH = 8
+
+
+def hash_password(password: str) -> str:
+    """Hashes a plain password using bcrypt."""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def hash_many(passwords, workers=None):
+    """Hashes passwords in parallel; returns the hashes in input order."""
+    passwords = list(passwords)
+    workers = max(1, min(workers or HASH_WORKERS, len(passwords)))
+    if workers == 1 or len(passwords) < MIN_POOL_BATCH:
+        return [hash_password(p) for p in passwords]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt-hash") as pool:
+        return list(pool.map(hash_password, passwords))
+
+
+def check(count=MIN_POOL_BATCH * 2, workers=4):
+    """Hashes a batch through the pool and checks the workers stayed light.
+
+    Fails if hashing started a child process or pulled Streamlit into
+    the process, and verifies every hash against its password.
+    """
+    import multiprocessing
+
+    before = set(sys.modules)
+    passwords = [f"check-{i}" for i in range(count)]
+    hashes = hash_many(passwords, workers=workers)
+
+    loaded = set(sys.modules) - before
+    assert not multiprocessing.active_children(), "hash_many started worker processes"
+    assert "streamlit" not in loaded, "hash_many workers imported streamlit"
+    assert not any(t.name.startswith("bcrypt-hash") for t in threading.enumerate()), \
+        "hash_many left worker threads running"
+    for password, hashed in zip(passwords, hashes):
+        assert bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    print(f"hash_many: {count} passwords, {workers} workers, no streamlit, no child processes")
+
+
+if __name__ == "__main__":
+    check()
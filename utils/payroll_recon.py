@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+
+# ------------------------------------------------------------
+# Cross-month payroll reconciliation.
+#
+# Each month is reduced to one row per Employee ID (the latest upload
+# wins; the row count is kept so duplicates can be flagged), then the two
+# months are hash-joined on Employee ID. Everything after the join is
+# column arithmetic, so hundreds of thousands of rows take seconds.
+# ------------------------------------------------------------
+ID_COL = "Employee ID"
+MONTH_COL = "payroll_month"
+COMPARE_COLS = ["Adj. Salary", "Current Salary", "Difference"]
+INFO_COLS = ["First Name", "Last Name", "Agency"]
+TOLERANCE = 0.005
+
+STATUSES = ["new", "dropped", "changed", "duplicate", "unchanged"]
+
+
+def _latest_per_employee(month_df, compare_cols):
+    cols = [c for c in [ID_COL] + INFO_COLS + compare_cols if c in month_df.columns]
+    if "uploaded_at" in month_df.columns:
+        month_df = month_df.sort_values("uploaded_at", kind="stable")
+    # Drop missing IDs first: astype(str) would turn them into "nan" /
+    # "<NA>" and merge every ID-less row into one phantom employee.
+    month_df = month_df.loc[month_df[ID_COL].notna(), cols].copy()
+    month_df[ID_COL] = month_df[ID_COL].astype(str).str.strip()
+    month_df = month_df[month_df[ID_COL] != ""]
+
+    counts = month_df[ID_COL].value_counts()
+    latest = month_df.drop_duplicates(ID_COL, keep="last").set_index(ID_COL)
+    latest["rows"] = counts.reindex(latest.index).to_numpy()
+    return latest
+
+
+def reconcile(df, month_a, month_b, compare_cols=None):
+    """Compares payroll month_a (earlier) with month_b, one row per employee.
+
+    status is one of:
+      new        only in month_b
+      dropped    only in month_a
+      duplicate  listed more than once in either month
+      changed    in both, and a compare column moved by more than TOLERANCE
+      unchanged  in both with the same values
+    For each compare column the result has "<col> (<month>)" values for
+    both months and a "<col> Δ" (month_b minus month_a).
+    """
+    compare_cols = [c for c in (compare_cols or COMPARE_COLS) if c in df.columns]
+    if ID_COL not in df.columns or MONTH_COL not in df.columns:
+        raise ValueError(f"Master data needs '{ID_COL}' and '{MONTH_COL}' columns.")
+
+    subset = df[df[MONTH_COL].isin([month_a, month_b])]
+    a = _latest_per_employee(subset[subset[MONTH_COL] == month_a], compare_cols)
+    b = _latest_per_employee(subset[subset[MONTH_COL] == month_b], compare_cols)
+
+    joined = a.join(b, how="outer", lsuffix="_a", rsuffix="_b")
+    rows_a = joined["rows_a"].fillna(0).astype(int)
+    rows_b = joined["rows_b"].fillna(0).astype(int)
+
+    out = pd.DataFrame(index=joined.index)
+    for col in INFO_COLS:
+        if f"{col}_b" in joined.columns:
+            out[col] = joined[f"{col}_b"].combine_first(joined[f"{col}_a"])
+
+    changed = np.zeros(len(joined), dtype=bool)
+    for col in compare_cols:
+        before = joined[f"{col}_a"]
+        after = joined[f"{col}_b"]
+        out[f"{col} ({month_a})"] = before
+        out[f"{col} ({month_b})"] = after
+        delta = after.fillna(0) - before.fillna(0)
+        out[f"{col} Δ"] = delta
+        changed |= (delta.abs() > TOLERANCE).to_numpy()
+
+    out[f"rows ({month_a})"] = rows_a
+    out[f"rows ({month_b})"] = rows_b
+
+    in_a = (rows_a > 0).to_numpy()
+    in_b = (rows_b > 0).to_numpy()
+    dup = ((rows_a > 1) | (rows_b > 1)).to_numpy()
+    out["status"] = np.select(
+        [dup, in_b & ~in_a, in_a & ~in_b, changed],
+        ["duplicate", "new", "dropped", "changed"],
+        default="unchanged",
+    )
+
+    out = out.reset_index()
+    order = pd.Categorical(out["status"], categories=STATUSES, ordered=True)
+    return out.assign(_order=order).sort_values(["_order", ID_COL]).drop(columns="_order").reset_index(drop=True)
+
+
+def summarize(result):
+    """Count per status plus the net change of each Δ column."""
+    summary = result["status"].value_counts().reindex(STATUSES, fill_value=0).to_dict()
+    for col in result.columns:
+        if col.endswith(" Δ"):
+            summary[col] = float(result[col].sum())
+    return summary
+
+
+def reconcile_consecutive(df, months=None, compare_cols=None):
+    """Batch API: reconciles each pair of consecutive payroll months.
+
+    Returns {(month_a, month_b): result DataFrame}.
+    """
+    months = sorted(months or df[MONTH_COL].dropna().unique())
+    return {
+        (a, b): reconcile(df, a, b, compare_cols)
+        for a, b in zip(months, months[1:])
+    }
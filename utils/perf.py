@@ -0,0 +1,160 @@
+import os
+import time
+import atexit
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# ------------------------------------------------------------
+# Lightweight timing spans.
+#
+# Each span name keeps its last RING_SIZE durations in a ring buffer;
+# percentiles are computed on read, so recording stays O(1).
+# ------------------------------------------------------------
+RING_SIZE = 1024
+METRICS_DIR = Path(os.environ.get("DDGHRMP_METRICS_DIR", "data/metrics"))
+EXPORT_INTERVAL = 30
+# Files of other processes not rewritten for this long are taken to be
+# left behind by a crashed or killed process and removed on export.
+STALE_EXPORT_SECONDS = int(os.environ.get("DDGHRMP_METRICS_STALE_SECONDS", str(EXPORT_INTERVAL * 10)))
+
+_samples = {}
+_counts = {}
+_totals = {}
+_lock = threading.Lock()
+_last_export = [0.0]
+_exported_paths = set()
+
+
+def record(name, seconds):
+    with _lock:
+        ring = _samples.get(name)
+        if ring is None:
+            ring = _samples[name] = deque(maxlen=RING_SIZE)
+        ring.append(seconds)
+        _counts[name] = _counts.get(name, 0) + 1
+        _totals[name] = _totals.get(name, 0.0) + seconds
+        # Claimed under the lock, so only one thread exports per interval.
+        due = time.monotonic() - _last_export[0] > EXPORT_INTERVAL
+        if due:
+            _last_export[0] = time.monotonic()
+
+    if due:
+        try:
+            export_prometheus()
+        except OSError as e:
+            print("Metrics export failed:", e)
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name=None):
+    """Decorator form of span(); defaults to the function's qualified name."""
+    def decorator(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, int(round(q * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+def snapshot():
+    """Returns one dict per span with count and p50/p90/p99/max in seconds."""
+    with _lock:
+        items = [(name, sorted(ring), _counts[name], _totals[name]) for name, ring in _samples.items()]
+
+    rows = []
+    for name, vals, count, total in sorted(items):
+        rows.append({
+            "span": name,
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "p50": _percentile(vals, 0.50),
+            "p90": _percentile(vals, 0.90),
+            "p99": _percentile(vals, 0.99),
+            "max": vals[-1] if vals else 0.0,
+        })
+    return rows
+
+
+def to_prometheus():
+    lines = [
+        "# HELP ddghrmp_span_seconds Duration of instrumented code paths.",
+        "# TYPE ddghrmp_span_seconds summary",
+    ]
+    pid = os.getpid()
+    for row in snapshot():
+        span_name = row["span"].replace("\\", "\\\\").replace('"', '\\"')
+        labels = f'span="{span_name}",pid="{pid}"'
+        for q in ("p50", "p90", "p99"):
+            quantile = int(q[1:]) / 100
+            lines.append(f'ddghrmp_span_seconds{{{labels},quantile="{quantile}"}} {row[q]:.6f}')
+        lines.append(f'ddghrmp_span_seconds_sum{{{labels}}} {row["mean"] * row["count"]:.6f}')
+        lines.append(f'ddghrmp_span_seconds_count{{{labels}}} {row["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path=None):
+    """Writes this process's text exposition file atomically.
+
+    One file per process, so replicas behind the load balancer don't
+    overwrite each other in node_exporter's textfile directory. The file
+    is removed when the process exits; files of processes that died
+    without exiting cleanly are pruned once STALE_EXPORT_SECONDS old.
+    """
+    path = Path(path or METRICS_DIR / f"perf-{os.getpid()}.prom")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(to_prometheus())
+    os.replace(tmp, path)
+    if path not in _exported_paths:
+        _exported_paths.add(path)
+        atexit.register(_remove_export, path)
+    _prune_stale_exports(path.parent, keep=path)
+    return path
+
+
+def _remove_export(path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+def _prune_stale_exports(folder, keep):
+    cutoff = time.time() - STALE_EXPORT_SECONDS
+    for other in folder.glob("perf-*.prom"):
+        try:
+            if other != keep and other.stat().st_mtime < cutoff:
+                other.unlink()
+        except OSError:
+            # Removed by another process meanwhile.
+            pass
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _counts.clear()
+        _totals.clear()
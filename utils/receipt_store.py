@@ -0,0 +1,185 @@
+import os
+import shutil
+import hashlib
+from pathlib import Path
+
+try:
+    from PIL import Image
+    PIL_OK = True
+except Exception:
+    PIL_OK = False
+
+
+# ------------------------------------------------------------
+# Content-addressed receipt storage.
+#
+# A receipt lives at data/receipts/sha256/<h[:2]>/<h>.<ext>, so the same
+# image uploaded twice is stored once, whatever its file name or
+# extension: lookups go by digest alone, and the extension of the first
+# upload (normalised, e.g. .jpeg -> .jpg) is kept for display. Files already on disk are hard-
+# linked into the store rather than copied. The path returned is what
+# goes into the receipt_path columns.
+#
+# Thumbnails are made on first request and cached under thumbs/; the
+# cache is trimmed oldest-access-first once it exceeds THUMB_CACHE_BYTES.
+# ------------------------------------------------------------
+RECEIPTS_DIR = Path(os.environ.get("DDGHRMP_RECEIPTS_DIR", "data/receipts"))
+OBJECTS_DIR = RECEIPTS_DIR / "sha256"
+THUMBS_DIR = RECEIPTS_DIR / "thumbs"
+THUMB_SIZE = 256
+THUMB_CACHE_BYTES = int(os.environ.get("DDGHRMP_THUMB_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+_CHUNK = 1024 * 1024
+_SUFFIX_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".tif": ".tiff"}
+
+
+def _object_path(digest, suffix):
+    """Existing stored object for digest, else where a new one goes."""
+    folder = OBJECTS_DIR / digest[:2]
+    for existing in folder.glob(f"{digest}*"):
+        if not existing.name.startswith("."):
+            return existing
+    suffix = suffix.lower()
+    return folder / f"{digest}{_SUFFIX_ALIASES.get(suffix, suffix)}"
+
+
+def _digest_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_stored(receipt_path):
+    try:
+        Path(receipt_path).resolve().relative_to(OBJECTS_DIR.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def store_bytes(data: bytes, filename: str) -> str:
+    """Stores an uploaded receipt and returns its content-addressed path."""
+    digest = hashlib.sha256(data).hexdigest()
+    target = _object_path(digest, Path(filename).suffix)
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+    return target.as_posix()
+
+
+def _link_or_copy(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        # Different filesystem, or no hard-link support.
+        shutil.copy2(src, dest)
+
+
+def store_file(path, relink_duplicates=True) -> str:
+    """Moves an on-disk receipt into the store by hard link; returns the store path.
+
+    With relink_duplicates, a file whose content is already stored is
+    replaced by a hard link to the stored copy, so both names share one
+    inode and the duplicate's disk space is freed.
+    """
+    path = Path(path)
+    target = _object_path(_digest_file(path), path.suffix)
+
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        _link_or_copy(path, tmp)
+        os.replace(tmp, target)
+    elif relink_duplicates and not os.path.samefile(path, target):
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            os.link(target, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return target.as_posix()
+
+
+def ingest(receipt_path):
+    """Normalises a receipt_path value before it is written to the database.
+
+    Paths already in the store, empty values and missing files pass
+    through unchanged; any other existing file is stored and its
+    content-addressed path returned.
+    """
+    if not receipt_path or is_stored(receipt_path) or not os.path.isfile(receipt_path):
+        return receipt_path
+    return store_file(receipt_path)
+
+
+def import_existing(directory=None):
+    """Ingests every legacy receipt under directory. Returns {old_path: store_path}."""
+    directory = Path(directory or RECEIPTS_DIR)
+    mapping = {}
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.name.startswith("."):
+            continue
+        if is_stored(path) or THUMBS_DIR.resolve() in path.resolve().parents:
+            continue
+        mapping[path.as_posix()] = store_file(path)
+    return mapping
+
+
+def thumbnail(receipt_path, size=THUMB_SIZE):
+    """Returns a cached thumbnail path for receipt_path, building it on first use.
+
+    Falls back to the original path when Pillow is missing or the file is
+    not an image (e.g. a PDF receipt).
+    """
+    if not PIL_OK or not receipt_path or not os.path.isfile(receipt_path):
+        return receipt_path
+
+    key = Path(receipt_path).stem if is_stored(receipt_path) else _digest_file(receipt_path)
+    thumb = THUMBS_DIR / f"{key}_{size}.jpg"
+    if thumb.exists():
+        # Bump mtime: eviction goes by least recently served.
+        try:
+            os.utime(thumb)
+        except OSError:
+            pass
+        return thumb.as_posix()
+
+    try:
+        with Image.open(receipt_path) as img:
+            img.thumbnail((size, size))
+            THUMBS_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = thumb.with_name(f".{thumb.name}.{os.getpid()}.tmp")
+            img.convert("RGB").save(tmp, "JPEG", quality=80, optimize=True)
+            os.replace(tmp, thumb)
+    except (OSError, ValueError):
+        return receipt_path
+
+    _evict_thumbnails()
+    return thumb.as_posix()
+
+
+def _evict_thumbnails(limit=None):
+    limit = THUMB_CACHE_BYTES if limit is None else limit
+    entries = []
+    total = 0
+    for path in THUMBS_DIR.glob("*.jpg"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    for _, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            path.unlink()
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,444 @@
+import os
+import json
+import hashlib
+import time
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    ARROW_OK = True
+except Exception:
+    ARROW_OK = False
+
+
+# ------------------------------------------------------------
+# Shared, memory-mapped copy of a prepared DataFrame.
+#
+# One Streamlit process publishes the dataset as an Arrow IPC file and
+# atomically swaps a small CURRENT pointer to it. Every other process
+# memory-maps the same file and only remaps when CURRENT changes, so the
+# OS page cache holds one copy no matter how many replicas are running.
+#
+# Partitioned datasets can also be published incrementally
+# (publish_partitions / ensure_partitions): a refresh rewrites only the
+# partitions it re-read and carries the other files over to the new
+# version unchanged.
+# ------------------------------------------------------------
+SHARED_DIR = Path(os.environ.get("DDGHRMP_SHARED_DIR", "data/shared"))
+KEEP_VERSIONS = 2
+LOCK_STALE_SECONDS = 120
+# Scoped frames kept mapped per process, least recently read evicted first.
+MAX_MAPPED = int(os.environ.get("DDGHRMP_SHARED_MAX_MAPPED", "16"))
+
+_mapped = OrderedDict()
+_mapped_lock = threading.RLock()
+
+
+def _dataset_dir(name):
+    path = SHARED_DIR / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _write_atomic(path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def current_version(name):
+    """Returns the pointer {"version", "file", "published_at"} or None."""
+    pointer = SHARED_DIR / name / "CURRENT"
+    try:
+        with open(pointer, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _to_arrow(df):
+    # get_all_records gives mixed int/str object columns (IDs, accounts),
+    # which Arrow refuses to infer. Pin them to pandas' nullable string.
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].astype("string")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _write_table(path, table):
+    tmp = path.with_name(f".{path.name}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _partition_value(value):
+    # Partition keys are matched case- and whitespace-insensitively.
+    return None if value is None or pd.isna(value) else str(value).strip().casefold()
+
+
+def _new_version():
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def _write_partitions(folder, name, version, df, table, partition_by):
+    """Writes one file per distinct combination of partition_by; returns their entries."""
+    keys = [c for c in partition_by or [] if c in df.columns]
+    if not keys:
+        return []
+    partitions = []
+    groups = df.reset_index(drop=True).groupby(keys, dropna=False, sort=True).indices
+    for i, (values, rows) in enumerate(groups.items()):
+        values = values if isinstance(values, tuple) else (values,)
+        part_name = f"{name}-{version}.part{i:05d}.arrow"
+        _write_table(folder / part_name, table.take(pa.array(rows)))
+        partitions.append({
+            "values": {k: _partition_value(v) for k, v in zip(keys, values)},
+            # The values as written, for showing to users.
+            "labels": {k: None if pd.isna(v) else str(v).strip() for k, v in zip(keys, values)},
+            "file": part_name,
+            "rows": int(len(rows)),
+        })
+    return partitions
+
+
+def _swap(folder, pointer):
+    _write_atomic(folder / "CURRENT", json.dumps(pointer).encode("utf-8"))
+    _prune(folder, pointer)
+
+
+def publish(name, df, partition_by=None):
+    """Writes df as a new version and swaps CURRENT to it. Returns the version.
+
+    With partition_by, each distinct combination of those columns is also
+    written as its own file, so scoped readers (read(where=...)) map only
+    their partitions instead of the whole dataset.
+    """
+    folder = _dataset_dir(name)
+    version = _new_version()
+    filename = f"{name}-{version}.arrow"
+
+    table = _to_arrow(df)
+    _write_table(folder / filename, table)
+    partitions = _write_partitions(folder, name, version, df, table, partition_by)
+
+    _swap(folder, {
+        "version": version,
+        "file": filename,
+        "partitions": partitions,
+        "published_at": time.time(),
+    })
+    return version
+
+
+def publish_partitions(name, df, partition_by, column, refreshed=None):
+    """Publishes df's rows as the partitions for the refreshed values of column.
+
+    Partitions of the current version whose column value is in refreshed
+    are replaced by df's; all others are carried over as they are, so a
+    refresh writes only what it re-read. refreshed=None replaces every
+    partition. The version has no single full-table file: unscoped reads
+    map every partition. Returns the version.
+    """
+    folder = _dataset_dir(name)
+    version = _new_version()
+    previous = current_version(name) or {}
+    now = time.time()
+
+    partitions = _write_partitions(folder, name, version, df, _to_arrow(df), partition_by)
+    if refreshed is None:
+        loaded = {}
+    else:
+        replaced = _wanted(list(refreshed))
+        partitions = [
+            part for part in previous.get("partitions") or []
+            if part["values"].get(column) not in replaced
+        ] + partitions
+        loaded = dict(previous.get("loaded") or {})
+        loaded.update({value: now for value in replaced})
+    for part in partitions:
+        loaded.setdefault(part["values"].get(column), now)
+
+    _swap(folder, {
+        "version": version,
+        "file": None,
+        "partitions": partitions,
+        "loaded": {k: v for k, v in loaded.items() if k is not None},
+        "published_at": now,
+    })
+    return version
+
+
+def _prune(folder, pointer):
+    """Deletes files of all but the newest KEEP_VERSIONS versions, except those pointer uses."""
+    in_use = {pointer.get("file")} | {part["file"] for part in pointer.get("partitions") or []}
+    # Group files by version (the name up to the first dot after it).
+    versions = {}
+    for path in folder.glob("*.arrow"):
+        versions.setdefault(path.name.split(".")[0], []).append(path)
+    newest = sorted(versions, key=lambda v: max(p.stat().st_mtime for p in versions[v]), reverse=True)
+    for old in newest[KEEP_VERSIONS:]:
+        for path in versions[old]:
+            if path.name in in_use:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                # Still mapped by a reader on Windows; next publish retries.
+                pass
+
+
+_STRING_TYPES = {}
+if ARROW_OK:
+    _STRING_TYPES = {
+        pa.string(): pd.StringDtype("pyarrow"),
+        pa.large_string(): pd.StringDtype("pyarrow"),
+    }
+
+
+def _wanted(value):
+    """Partition values accepted for one where entry: a value or a list of them."""
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return {_partition_value(v) for v in value}
+    return {_partition_value(value)}
+
+
+def _scope_key(where):
+    if not where:
+        return ""
+    return ";".join(
+        f"{k}={'|'.join(sorted(str(v) for v in _wanted(value)))}" for k, value in sorted(where.items())
+    )
+
+
+def matches(df, where):
+    """Boolean row mask of df for where, compared the way partitions are."""
+    keep = np.ones(len(df), dtype=bool)
+    for col, value in (where or {}).items():
+        if col not in df.columns:
+            return np.zeros(len(df), dtype=bool)
+        keep &= df[col].map(_partition_value).isin(_wanted(value)).to_numpy(dtype=bool)
+    return keep
+
+
+def _remember(cache_key, files_key, df):
+    _mapped[cache_key] = (files_key, df)
+    _mapped.move_to_end(cache_key)
+    while len(_mapped) > MAX_MAPPED:
+        _mapped.popitem(last=False)
+
+
+def _all_files(pointer):
+    if pointer.get("file"):
+        return [pointer["file"]]
+    return [part["file"] for part in pointer.get("partitions") or []]
+
+
+def _files_for(pointer, where):
+    """Files to map for where, or None if the version has no matching partitioning."""
+    if not where:
+        return _all_files(pointer)
+    wanted = {k: _wanted(v) for k, v in where.items()}
+    partitions = pointer.get("partitions") or []
+    if not partitions or not set(wanted) <= set(partitions[0]["values"]):
+        return None
+    return [
+        part["file"] for part in partitions
+        if all(part["values"].get(k) in v for k, v in wanted.items())
+    ]
+
+
+def _frame_version(files_key):
+    # Derived from the files mapped, so a scope keeps its version (and its
+    # per-version caches) across publishes that didn't rewrite its partitions.
+    return hashlib.sha1("\n".join(files_key).encode("utf-8")).hexdigest()[:16]
+
+
+def partition_values(name, column):
+    """Distinct (normalised) values of a partition column in the current version."""
+    pointer = current_version(name) or {}
+    return sorted({
+        part["values"][column] for part in pointer.get("partitions") or []
+        if part["values"].get(column) is not None
+    })
+
+
+def partition_labels(name, column):
+    """Distinct values of a partition column as written, one per normalised value."""
+    pointer = current_version(name) or {}
+    labels = {}
+    for part in pointer.get("partitions") or []:
+        value = part["values"].get(column)
+        if value is not None:
+            labels.setdefault(value, (part.get("labels") or {}).get(column) or value)
+    return sorted(labels.values(), key=str.casefold)
+
+
+def read(name, where=None):
+    """Returns the current version as a DataFrame backed by a memory map.
+
+    where restricts the result to matching partitions, e.g.
+    {"Agency": "MOH", "payroll_month": ["2025-01", "2025-02"]} (a list
+    matches any of its values); only those partition files are mapped. The frame
+    is shared by every session in this process with the same scope —
+    callers must not mutate it in place.
+    """
+    pointer = current_version(name)
+    if pointer is None:
+        return None
+
+    cache_key = (name, _scope_key(where))
+    files = _files_for(pointer, where)
+    # Published without these partitions: the full table is filtered.
+    files_key = tuple(files) if files is not None else ("filtered", pointer["version"])
+    with _mapped_lock:
+        cached = _mapped.get(cache_key)
+        if cached and cached[0] == files_key:
+            _mapped.move_to_end(cache_key)
+            return cached[1]
+
+        if files is None:
+            full = read(name)
+            if full is None:
+                return None
+            df = full[matches(full, where)].reset_index(drop=True)
+            df.attrs["version"] = _frame_version(files_key + (cache_key[1],))
+            _remember(cache_key, files_key, df)
+            return df
+
+        try:
+            tables = []
+            for filename in files:
+                source = pa.memory_map(str(SHARED_DIR / name / filename), "r")
+                tables.append(ipc.open_file(source).read_all())
+            if tables:
+                # Partitions written by different refreshes may differ in
+                # inferred types (an all-integer month); unify them.
+                table = pa.concat_tables(tables, promote_options="permissive")
+            elif _all_files(pointer):
+                # Empty scope: same columns as the full dataset, no rows.
+                source = pa.memory_map(str(SHARED_DIR / name / _all_files(pointer)[0]), "r")
+                table = ipc.open_file(source).schema.empty_table()
+            else:
+                table = None
+        except (OSError, pa.ArrowInvalid):
+            return cached[1] if cached else None
+
+        # Arrow-backed strings keep the text columns inside the map
+        # instead of materialising one Python object per cell.
+        df = pd.DataFrame() if table is None else table.to_pandas(split_blocks=True, types_mapper=_STRING_TYPES.get)
+        df.attrs["version"] = _frame_version(files_key)
+        _remember(cache_key, files_key, df)
+        return df
+
+
+def _try_lock(folder):
+    lock = folder / "PUBLISH.lock"
+    try:
+        if time.time() - lock.stat().st_mtime > LOCK_STALE_SECONDS:
+            lock.unlink()
+    except OSError:
+        pass
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        os.close(fd)
+        return lock
+    except FileExistsError:
+        return None
+
+
+def _is_fresh(pointer, max_age):
+    return pointer is not None and time.time() - pointer["published_at"] < max_age
+
+
+def ensure(name, build, max_age, partition_by=None):
+    """Publishes build() as name unless the current version is younger than max_age.
+
+    Only one process rebuilds at a time; the others keep serving the
+    previous version until the new one is published.
+    """
+    if not _is_fresh(current_version(name), max_age):
+        folder = _dataset_dir(name)
+        lock = _try_lock(folder)
+        while lock is None and current_version(name) is None:
+            # First publish is running in another process; wait for it.
+            time.sleep(0.5)
+            lock = _try_lock(folder)
+
+        if lock is not None:
+            try:
+                if not _is_fresh(current_version(name), max_age):
+                    publish(name, build(), partition_by=partition_by)
+            finally:
+                try:
+                    lock.unlink()
+                except OSError:
+                    pass
+    return current_version(name)
+
+
+def _stale_values(pointer, wanted, max_age):
+    """Values of wanted to rebuild: a list ([] if all are fresh), or None for everything."""
+    loaded = (pointer or {}).get("loaded") or {}
+    now = time.time()
+    if wanted is None:
+        return None if not loaded or now - min(loaded.values()) >= max_age else []
+    return [v for v in wanted if now - loaded.get(_partition_value(v), 0) >= max_age]
+
+
+def _missing(pointer, wanted):
+    loaded = (pointer or {}).get("loaded") or {}
+    if wanted is None:
+        return not loaded
+    return any(_partition_value(v) not in loaded for v in wanted)
+
+
+def ensure_partitions(name, column, wanted, build, max_age, partition_by):
+    """Loads the values of column in wanted that are missing or older than max_age.
+
+    build(values) returns the rows for those values, or every row when
+    values is None (wanted=None asks for everything); only their
+    partitions are rewritten. Only one process rebuilds at a time; the
+    others keep serving what is published and wait only for values that
+    were never loaded. Returns the pointer.
+    """
+    wanted = None if wanted is None else list(wanted)
+    if _stale_values(current_version(name), wanted, max_age) == []:
+        return current_version(name)
+
+    folder = _dataset_dir(name)
+    lock = _try_lock(folder)
+    while lock is None and _missing(current_version(name), wanted):
+        # Another process is loading; wait for it, then load what is still missing.
+        time.sleep(0.5)
+        lock = _try_lock(folder)
+
+    if lock is not None:
+        try:
+            stale = _stale_values(current_version(name), wanted, max_age)
+            if stale != []:
+                publish_partitions(name, build(stale), partition_by, column, refreshed=stale)
+        finally:
+            try:
+                lock.unlink()
+            except OSError:
+                pass
+    return current_version(name)
+
+
+def get_or_publish(name, build, max_age, partition_by=None, where=None):
+    """Maps the current version (see read()), rebuilding it first if older than max_age."""
+    ensure(name, build, max_age, partition_by=partition_by)
+    return read(name, where=where)
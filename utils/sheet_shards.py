@@ -0,0 +1,242 @@
+import os
+import re
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import perf
+
+
+# ------------------------------------------------------------
+# Month-sharded master sheet.
+#
+# Rows are appended to one worksheet per payroll month,
+# "<base>_YYYY-MM", instead of a single ever-growing worksheet. The
+# "_manifest" worksheet lists (month, spreadsheet, worksheet), so a reader
+# finds the shards for the months it needs without opening the others.
+#
+# Google's cell limit is per spreadsheet, so each year's shards live in a
+# spreadsheet of their own, created on the year's first upload and listed
+# in the "_spreadsheets" worksheet of the main one. Undated rows and the
+# manifest stay in the main spreadsheet.
+#
+# The pre-sharding worksheet (<base> itself) is kept as is and listed
+# once for every month it contains; readers filter its rows by month.
+#
+# The manifest is only ever appended to, so concurrent uploads cannot
+# overwrite each other's entries; duplicate rows are ignored on read.
+# ------------------------------------------------------------
+MANIFEST_WORKSHEET = "_manifest"
+MANIFEST_HEADERS = ["month", "spreadsheet_id", "worksheet", "created_at"]
+MONTH_COLUMNS = ["Payroll Month", "Payroll_month", "payroll_month", "Month", "PayrollMonth"]
+UNDATED = "undated"
+READ_WORKERS = 4
+SPREADSHEETS_WORKSHEET = "_spreadsheets"
+SPREADSHEETS_HEADERS = ["year", "spreadsheet_id", "created_at"]
+# Drive folder for the per-year spreadsheets; the account's root if unset.
+SHARD_FOLDER_ID = os.environ.get("DDGHRMP_SHARD_FOLDER_ID") or None
+
+_MONTH_KEY = re.compile(r"\d{4}-\d{2}")
+
+
+def month_key(df):
+    """"YYYY-MM" shard key per row: the payroll month column, else uploaded_at."""
+    keys = pd.Series(UNDATED, index=df.index, dtype=object)
+    if "uploaded_at" in df.columns:
+        uploaded = pd.to_datetime(df["uploaded_at"], errors="coerce")
+        keys = keys.mask(uploaded.notna(), uploaded.dt.strftime("%Y-%m"))
+    column = next((c for c in MONTH_COLUMNS if c in df.columns), None)
+    if column:
+        stated = pd.to_datetime(df[column].astype(str).str.strip(), errors="coerce", format="mixed")
+        keys = keys.mask(stated.notna(), stated.dt.strftime("%Y-%m"))
+    return keys
+
+
+def shard_title(base, month):
+    return f"{base}_{month}"
+
+
+def shard_year(month):
+    """The year a month's shard is filed under, or None for UNDATED."""
+    return month[:4] if _MONTH_KEY.fullmatch(str(month)) else None
+
+
+def _worksheet(sh, title, rows=100, cols=26, created=None):
+    """Opens title in sh, creating it if missing. created (a list) records new titles."""
+    import gspread
+
+    try:
+        return sh.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        pass
+    try:
+        ws = sh.add_worksheet(title=title, rows=rows, cols=cols)
+        if created is not None:
+            created.append(title)
+        return ws
+    except gspread.exceptions.APIError:
+        # Another upload created it first.
+        return sh.worksheet(title)
+
+
+def _manifest_rows(values):
+    rows = []
+    for row in values[1:]:
+        entry = dict(zip(MANIFEST_HEADERS, row))
+        if entry.get("month") and entry.get("worksheet"):
+            rows.append(entry)
+    return rows
+
+
+def _open_manifest(sh, base):
+    """The manifest worksheet; on first use it is created and the legacy sheet listed."""
+    created = []
+    ws = _worksheet(sh, MANIFEST_WORKSHEET, rows=100, cols=len(MANIFEST_HEADERS), created=created)
+    if not created:
+        return ws
+
+    ws.append_row(MANIFEST_HEADERS, value_input_option="RAW")
+    titles = [w.title for w in sh.worksheets()]
+    if base in titles:
+        values = sh.worksheet(base).get_all_values()
+        if len(values) > 1:
+            legacy = pd.DataFrame(values[1:], columns=values[0])
+            now = datetime.utcnow().isoformat()
+            ws.append_rows(
+                [[m, sh.id, base, now] for m in sorted(month_key(legacy).unique())],
+                value_input_option="RAW",
+            )
+    return ws
+
+
+@perf.timed("gsheet.read_manifest")
+def read_manifest(gc, sheet_id):
+    """Manifest entries as a DataFrame, or None if the sheet is not sharded yet."""
+    import gspread
+
+    try:
+        values = gc.open_by_key(sheet_id).worksheet(MANIFEST_WORKSHEET).get_all_values()
+    except gspread.exceptions.WorksheetNotFound:
+        return None
+    manifest = pd.DataFrame(_manifest_rows(values), columns=MANIFEST_HEADERS)
+    manifest["spreadsheet_id"] = manifest["spreadsheet_id"].replace("", sheet_id)
+    return manifest.drop_duplicates(["month", "spreadsheet_id", "worksheet"]).reset_index(drop=True)
+
+
+def sort_months(values):
+    """"YYYY-MM" keys newest first; UNDATED (and anything else) after them."""
+    values = list(values)
+    dated = sorted((v for v in values if _MONTH_KEY.fullmatch(str(v))), reverse=True)
+    return dated + sorted(v for v in values if not _MONTH_KEY.fullmatch(str(v)))
+
+
+def months(manifest):
+    """Months present in the manifest, newest first."""
+    return sort_months(manifest["month"].unique())
+
+
+def shards_for(manifest, selected):
+    """Distinct (spreadsheet_id, worksheet) pairs holding rows of the selected months."""
+    chosen = manifest[manifest["month"].isin(list(selected))]
+    return list(dict.fromkeys(zip(chosen["spreadsheet_id"], chosen["worksheet"])))
+
+
+def _year_spreadsheets(sh):
+    """The "_spreadsheets" worksheet and its {year: spreadsheet_id}, first listed winning."""
+    created = []
+    ws = _worksheet(sh, SPREADSHEETS_WORKSHEET, cols=len(SPREADSHEETS_HEADERS), created=created)
+    if created:
+        ws.append_row(SPREADSHEETS_HEADERS, value_input_option="RAW")
+    years = {}
+    for row in ws.get_all_values()[1:]:
+        entry = dict(zip(SPREADSHEETS_HEADERS, row))
+        if entry.get("year") and entry.get("spreadsheet_id"):
+            years.setdefault(entry["year"], entry["spreadsheet_id"])
+    return ws, years
+
+
+def _create_year_spreadsheet(gc, sh, year, years_ws):
+    """Creates and lists the spreadsheet for year; returns the id every upload agrees on."""
+    book = gc.create(f"{sh.title} {year}", folder_id=SHARD_FOLDER_ID)
+    years_ws.append_row([year, book.id, datetime.utcnow().isoformat()], value_input_option="RAW")
+    # Two uploads may both have created one; the first listed is kept.
+    _, years = _year_spreadsheets(sh)
+    chosen = years.get(year, book.id)
+    if chosen != book.id:
+        gc.del_spreadsheet(book.id)
+    return chosen
+
+
+@perf.timed("gsheet.append_sharded")
+def append_sharded(gc, sheet_id, base, df):
+    """Appends df's rows to the monthly shards of base; returns the row count."""
+    sh = gc.open_by_key(sheet_id)
+    manifest_ws = _open_manifest(sh, base)
+    keys = month_key(df)
+
+    # Where each month's shard already lives (the legacy sheet is not a shard).
+    listed = {}
+    for entry in _manifest_rows(manifest_ws.get_all_values()):
+        if entry["worksheet"] == shard_title(base, entry["month"]):
+            listed.setdefault(entry["month"], entry.get("spreadsheet_id") or sh.id)
+
+    books = {sh.id: sh}
+    years_ws, years = None, None
+
+    def book_for(month):
+        spreadsheet_id = listed.get(month)
+        year = shard_year(month)
+        if spreadsheet_id is None and year is not None:
+            nonlocal years_ws, years
+            if years is None:
+                years_ws, years = _year_spreadsheets(sh)
+            if year not in years:
+                years[year] = _create_year_spreadsheet(gc, sh, year, years_ws)
+            spreadsheet_id = years[year]
+        spreadsheet_id = spreadsheet_id or sh.id
+        if spreadsheet_id not in books:
+            books[spreadsheet_id] = gc.open_by_key(spreadsheet_id)
+        return books[spreadsheet_id]
+
+    groups = list(df.groupby(keys, sort=True))
+    shards, new_entries = [], []
+    for month, rows in groups:
+        book = book_for(month)
+        ws = _worksheet(book, shard_title(base, month), rows=len(rows) + 1, cols=len(df.columns))
+        if month not in listed:
+            new_entries.append([month, book.id, ws.title, datetime.utcnow().isoformat()])
+        shards.append(ws)
+    # Listed before any rows are written: an interrupted upload can leave
+    # an empty shard in the manifest, never rows no reader can find.
+    if new_entries:
+        manifest_ws.append_rows(new_entries, value_input_option="RAW")
+
+    for ws, (_, rows) in zip(shards, groups):
+        # Header check reads one row, not the whole shard.
+        if not ws.row_values(1):
+            ws.append_row(df.columns.tolist(), value_input_option="USER_ENTERED")
+        ws.append_rows(rows.fillna("").astype(str).values.tolist(),
+                       value_input_option="USER_ENTERED")
+    return len(df)
+
+
+def read_shards(creds, shards, read_one, workers=READ_WORKERS):
+    """Calls read_one(worksheet) for each (spreadsheet_id, worksheet) concurrently.
+
+    Each thread authorizes its own gspread client; one client's HTTP
+    session must not be shared across threads. Results keep the order of
+    shards.
+    """
+    import gspread
+
+    def fetch(shard):
+        spreadsheet_id, title = shard
+        with perf.span("gsheet.read_shard"):
+            gc = gspread.authorize(creds)
+            return read_one(gc.open_by_key(spreadsheet_id).worksheet(title))
+
+    if len(shards) <= 1:
+        return [fetch(s) for s in shards]
+    with ThreadPoolExecutor(max_workers=min(workers, len(shards)), thread_name_prefix="gsheet") as pool:
+        return list(pool.map(fetch, shards))
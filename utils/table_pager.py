@@ -0,0 +1,40 @@
+import hashlib
+import numpy as np
+
+
+# ------------------------------------------------------------
+# Server-side sorting and paging of a large frame.
+#
+# A sort permutation of the full dataset is computed once per
+# (data version, column, direction) and shared by all sessions. A filter
+# just selects from that permutation (O(n) once per filter change), and
+# a page is a slice of it — O(page size) whatever the page number. Only
+# the visible rows are ever sent to the browser.
+# ------------------------------------------------------------
+
+
+def sort_permutation(df, column, ascending=True):
+    """Row positions of df ordered by column; missing values last either way."""
+    values = df[column].reset_index(drop=True)
+    ordered = values.sort_values(ascending=ascending, kind="stable", na_position="last")
+    return ordered.index.to_numpy()
+
+
+def mask_key(mask):
+    """Short, stable fingerprint of a boolean row mask."""
+    return hashlib.blake2b(np.packbits(mask).tobytes(), digest_size=16).hexdigest()
+
+
+def filtered_order(permutation, mask):
+    """The permutation restricted to rows where mask is True, order kept."""
+    return permutation[mask[permutation]]
+
+
+def page_count(total_rows, page_size):
+    return max(1, -(-total_rows // page_size))
+
+
+def page(df, order, page_number, page_size):
+    """Rows of page page_number (1-based) in the given order."""
+    start = (page_number - 1) * page_size
+    return df.iloc[order[start:start + page_size]]
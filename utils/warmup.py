@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+import importlib
+
+from utils import perf
+
+
+# ------------------------------------------------------------
+# Background warm-up and startup-time report.
+#
+# Streamlit only runs app.py once a browser connects, so the first
+# session kicks off warm-up: page modules (and their heavy plotting /
+# Google imports) load in a daemon thread while the user is still typing
+# credentials, and each module's optional warm() primes its data caches.
+# ------------------------------------------------------------
+def _process_started_at():
+    """Wall-clock start time of this process (Linux), else the time of import."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, starttime, in clock ticks after boot. The command
+            # name (field 2) may contain spaces, so split after its ")".
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+PROCESS_STARTED_AT = _process_started_at()
+
+_events = {}
+_lock = threading.Lock()
+_started = [False]
+
+
+def mark(event):
+    """Records the first time event happens, in seconds since server start."""
+    with _lock:
+        if event in _events:
+            return
+        elapsed = time.time() - PROCESS_STARTED_AT
+        _events[event] = elapsed
+    perf.record(f"startup.{event}", elapsed)
+    print(f"[startup] {event}: {elapsed:.2f}s")
+
+
+def report():
+    with _lock:
+        return dict(sorted(_events.items(), key=lambda kv: kv[1]))
+
+
+def _warm(modules):
+    mark("warmup_started")
+    for name in modules:
+        try:
+            with perf.span(f"startup.import.{name}"):
+                module = importlib.import_module(name)
+        except Exception as e:
+            print(f"Warm-up import of {name} failed:", e)
+            continue
+
+        warm = getattr(module, "warm", None)
+        if warm is None:
+            continue
+        try:
+            with perf.span(f"startup.warm.{name}"):
+                warm()
+        except Exception as e:
+            print(f"Warm-up of {name} failed:", e)
+    mark("warmup_finished")
+
+
+def start(modules):
+    """Starts the warm-up thread once per process; later calls are no-ops."""
+    with _lock:
+        if _started[0]:
+            return
+        _started[0] = True
+    threading.Thread(target=_warm, args=(list(modules),), name="warmup", daemon=True).start()